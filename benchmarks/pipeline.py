@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# © 2016 Bernd Busse, The MIT License
+#
+
+"""Headless benchmark of the render and update pipeline
+
+Runs `Orange` against a fixed number of outputs and an in-memory lemonbar
+and reports frames per second, event-to-write latency, bytes written and
+memory allocated per frame for a few typical scenarios.
+"""
+
+import argparse
+from bisect import bisect_left
+import sys
+from threading import Thread
+import time
+from time import perf_counter
+import tracemalloc
+
+from gi.repository import GLib
+
+import orangeslices as osl
+from orangeslices import slice
+
+SCENARIOS = {}
+
+
+def scenario(name):
+    def register(func):
+        SCENARIOS[name] = func
+        return func
+    return register
+
+
+class Sink(object):
+    """in-memory lemonbar, records the time and size of every frame"""
+
+    def __init__(self):
+        super().__init__()
+        self.times = []
+        self.bytes = 0
+
+    def write(self, data):
+        now = perf_counter()
+        for _ in range(data.count('\n')):
+            self.times.append(now)
+        self.bytes += len(data.encode('utf-8'))
+
+    def flush(self):
+        pass
+
+
+class Workspaces(slice.Slice):
+    def __init__(self, count, screens, **kwargs):
+        super().__init__(**kwargs)
+        self.__count = count * screens
+        self.__focused = 0
+
+        for i in range(self.__count):
+            self._add_cut(i, str(i % count + 1),
+                          screen=slice.ScreenNumber.from_index(i // count))
+
+    def focus_next(self):
+        self._update_cut(self.__focused, bg=self._color_bg)
+        self.__focused = (self.__focused + 1) % self.__count
+        self._update_cut(self.__focused, bg=slice.SliceColor("#1793D1"))
+
+    def update(self):
+        pass
+
+
+class SimulatedClock(osl.slices.Clock):
+    """clock moving one second ahead on every update"""
+
+    def __init__(self, timefmt, **kwargs):
+        self.__timefmt = timefmt
+        self.__now = time.time()
+        super().__init__(timefmt=timefmt, **kwargs)
+
+    def update(self):
+        self.__now += 1
+        self._update_cut(0, time.strftime(self.__timefmt,
+                                          time.localtime(self.__now)))
+
+
+class Title(slice.Slice):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._add_cut(0, "")
+
+    def set_title(self, text):
+        self._update_cut(0, text)
+
+    def update(self):
+        pass
+
+
+@scenario("1 clock")
+def clock(orange, events):
+    # every event has to change the text, or its frame is skipped
+    sl = SimulatedClock(timefmt="%H:%M:%S")
+    orange.add(sl)
+
+    def event():
+        sl.update()
+        sl.propagate()
+
+    return event, None
+
+
+@scenario("20 workspaces x 3 screens")
+def workspaces(orange, events):
+    sl = Workspaces(20, 3)
+    orange.add(sl)
+    orange.add(osl.slices.Clock(align=osl.ALIGN_RIGHT))
+
+    def event():
+        sl.focus_next()
+        sl.propagate()
+
+    return event, None
+
+
+@scenario("title event storm")
+def title_storm(orange, events):
+    sl = Title(align=osl.ALIGN_CENTER)
+    orange.add(Workspaces(10, 1))
+    orange.add(sl)
+    counter = iter(range(sys.maxsize))
+
+    def event():
+        sl.set_title("Window title number {:d}".format(next(counter)))
+        sl.propagate()
+
+    # post from a worker thread like the i3 event thread does
+    def storm(record):
+        for n in range(events):
+            record()
+            sl._post(sl.set_title, "Window title number {:d}".format(n))
+
+    return event, storm
+
+
+def percentile(values, fraction):
+    if len(values) == 0:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run_scenario(name, events, outputs, max_fps, period):
+    orange = osl.Orange(outputs=outputs, max_fps=max_fps)
+    event, worker = SCENARIOS[name](orange, events)
+    sink = Sink()
+    timestamps = []
+
+    def record():
+        timestamps.append(perf_counter())
+
+    def tick():
+        record()
+        event()
+        return len(timestamps) < events
+
+    def finish():
+        # give the last frame time to reach the sink
+        GLib.timeout_add(max(200, 2000 // (max_fps or 1000)), orange.stop)
+        return False
+
+    if worker is not None:
+        thread = Thread(target=worker, args=(record, ), daemon=True)
+
+        def wait():
+            if thread.is_alive():
+                return True
+            return finish()
+
+        GLib.idle_add(thread.start)
+        GLib.timeout_add(10, wait)
+    else:
+        def driver():
+            if not tick():
+                return finish()
+            return True
+
+        if period > 0:
+            GLib.timeout_add(period, driver)
+        else:
+            GLib.idle_add(driver)
+
+    start = perf_counter()
+    orange.run(outstream=sink)
+    duration = perf_counter() - start
+
+    latencies = []
+    for t in timestamps:
+        i = bisect_left(sink.times, t)
+        if i < len(sink.times):
+            latencies.append((sink.times[i] - t) * 1000)
+
+    frames = len(sink.times)
+    written = sink.bytes
+
+    # memory allocated while rendering a single frame
+    allocated = []
+    tracemalloc.start()
+    for _ in range(100):
+        event()
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        orange.do_update()
+        _, peak = tracemalloc.get_traced_memory()
+        allocated.append(peak - current)
+    tracemalloc.stop()
+
+    return {'events': events,
+            'frames': frames,
+            'fps': frames / duration,
+            'p50': percentile(latencies, 0.50),
+            'p95': percentile(latencies, 0.95),
+            'p99': percentile(latencies, 0.99),
+            'bytes': written / frames if frames > 0 else 0,
+            'alloc': sum(allocated) / len(allocated)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-s', '--scenario', action='append',
+                        choices=sorted(SCENARIOS),
+                        help="scenario to run (default: all)")
+    parser.add_argument('-n', '--events', type=int, default=1000,
+                        help="number of events per scenario")
+    parser.add_argument('-o', '--outputs', type=int, default=3,
+                        help="number of simulated outputs")
+    parser.add_argument('-f', '--max-fps', type=int, default=0,
+                        help="frame limit passed to Orange (0: unlimited)")
+    parser.add_argument('-p', '--period', type=int, default=0,
+                        help="milliseconds between two events (0: idle)")
+    args = parser.parse_args()
+
+    header = ("{:<28s} {:>7s} {:>7s} {:>9s} {:>8s} {:>8s} {:>8s} "
+              "{:>11s} {:>11s}")
+    row = ("{name:<28s} {events:>7d} {frames:>7d} {fps:>9.1f} {p50:>8.3f} "
+           "{p95:>8.3f} {p99:>8.3f} {bytes:>11.1f} {alloc:>11.1f}")
+
+    print(header.format("scenario", "events", "frames", "frames/s",
+                        "p50 ms", "p95 ms", "p99 ms",
+                        "bytes/frame", "alloc/frame"))
+    for name in args.scenario or sorted(SCENARIOS):
+        result = run_scenario(name, args.events, args.outputs,
+                              args.max_fps or None, args.period)
+        print(row.format(name=name, **result))
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# © 2016 Bernd Busse, The MIT License
+#
+
+"""Import-time budget check
+
+Imports `orangeslices` in a fresh interpreter the way a bar configuration
+does and fails if it takes longer than the budget or pulls in backends
+the configuration does not use.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# run from a checkout without installing the package
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (description, statements, modules that must not be imported)
+CASES = [
+    ("import orangeslices",
+     "import orangeslices as osl",
+     ('gi', 'i3ipc', 'xcffib')),
+    ("clock only",
+     "import orangeslices as osl; osl.Orange; osl.slices.Clock; "
+     "osl.ALIGN_LEFT; osl.SCREEN_ALL",
+     ('i3ipc', 'xcffib')),
+    ("commands",
+     "import orangeslices as osl; osl.Orange; osl.slices.Command; "
+     "osl.TYPE_PERIODIC",
+     ('i3ipc', 'xcffib')),
+]
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+{statements}
+duration = time.perf_counter() - start
+print(json.dumps({{'time': duration, 'modules': list(sys.modules)}}))
+"""
+
+
+def probe(statements):
+    output = subprocess.check_output(
+            [sys.executable, '-c', PROBE.format(statements=statements)],
+            cwd=ROOT, universal_newlines=True)
+    return json.loads(output.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-b', '--budget', type=float, default=250,
+                        help="maximum import time in milliseconds")
+    parser.add_argument('-r', '--repeat', type=int, default=5,
+                        help="number of runs, the fastest one counts")
+    args = parser.parse_args()
+
+    failed = False
+    for name, statements, forbidden in CASES:
+        results = [probe(statements) for _ in range(args.repeat)]
+        duration = min(r['time'] for r in results) * 1000
+        loaded = sorted(m for m in forbidden if m in results[0]['modules'])
+
+        status = "ok"
+        if duration > args.budget:
+            status = "FAIL: over budget"
+        elif len(loaded) > 0:
+            status = "FAIL: imported " + ', '.join(loaded)
+        failed = failed or status != "ok"
+
+        print("{:<24s} {:>8.1f} ms  {}".format(name, duration, status))
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -5,31 +5,59 @@
 #
 
 """Not yet implemented"""
-from .orange import Orange, OrangeStyle
-from .slice import SliceAlignment, ScreenNumber
-from .slices.commands import CommandType
-from . import slices
-
-ALIGN_LEFT = SliceAlignment.ALIGN_LEFT
-ALIGN_CENTER = SliceAlignment.ALIGN_CENTER
-ALIGN_RIGHT = SliceAlignment.ALIGN_RIGHT
-
-SCREEN_FIRST = ScreenNumber.SCREEN_FIRST
-SCREEN_SECOND = ScreenNumber.SCREEN_SECOND
-SCREEN_THIRD = ScreenNumber.SCREEN_THIRD
-SCREEN_FOURTH = ScreenNumber.SCREEN_FOURTH
-SCREEN_FIFTH = ScreenNumber.SCREEN_FIFTH
-SCREEN_SIXTH = ScreenNumber.SCREEN_SIXTH
-SCREEN_SEVENTH = ScreenNumber.SCREEN_SEVENTH
-SCREEN_EIGHTH = ScreenNumber.SCREEN_EIGHTH
-SCREEN_NINTH = ScreenNumber.SCREEN_NINTH
-SCREEN_ALL = ScreenNumber.SCREEN_ALL
-
-STYLE_BLOCKS = OrangeStyle.STYLE_BLOCKS
-STYLE_POWERLINE = OrangeStyle.STYLE_POWERLINE
-
-TYPE_ONESHOT = CommandType.TYPE_ONESHOT
-TYPE_PERIODIC = CommandType.TYPE_PERIODIC
-TYPE_PERSISTENT = CommandType.TYPE_PERSISTENT
+
+from importlib import import_module
+
+# name: (module, attribute), loaded on first access
+_LAZY = {
+    'Orange': ('.orange', 'Orange'),
+    'OrangeStyle': ('.orange', 'OrangeStyle'),
+    'SliceAlignment': ('.slice', 'SliceAlignment'),
+    'ScreenNumber': ('.slice', 'ScreenNumber'),
+    'CommandType': ('.slices.commands', 'CommandType'),
+
+    'ALIGN_LEFT': ('.slice', 'ALIGN_LEFT'),
+    'ALIGN_CENTER': ('.slice', 'ALIGN_CENTER'),
+    'ALIGN_RIGHT': ('.slice', 'ALIGN_RIGHT'),
+
+    'SCREEN_FIRST': ('.slice', 'SCREEN_FIRST'),
+    'SCREEN_SECOND': ('.slice', 'SCREEN_SECOND'),
+    'SCREEN_THIRD': ('.slice', 'SCREEN_THIRD'),
+    'SCREEN_FOURTH': ('.slice', 'SCREEN_FOURTH'),
+    'SCREEN_FIFTH': ('.slice', 'SCREEN_FIFTH'),
+    'SCREEN_SIXTH': ('.slice', 'SCREEN_SIXTH'),
+    'SCREEN_SEVENTH': ('.slice', 'SCREEN_SEVENTH'),
+    'SCREEN_EIGHTH': ('.slice', 'SCREEN_EIGHTH'),
+    'SCREEN_NINTH': ('.slice', 'SCREEN_NINTH'),
+    'SCREEN_ALL': ('.slice', 'SCREEN_ALL'),
+
+    'STYLE_BLOCKS': ('.orange', 'BLOCKS'),
+    'STYLE_POWERLINE': ('.orange', 'POWERLINE'),
+
+    'TYPE_ONESHOT': ('.slices.commands', 'ONESHOT'),
+    'TYPE_PERIODIC': ('.slices.commands', 'PERIODIC'),
+    'TYPE_PERSISTENT': ('.slices.commands', 'PERSISTENT'),
+}
+
+_SUBMODULES = ('bar', 'ipc', 'markup', 'orange', 'outputs', 'sampler',
+               'slice', 'slices', 'stats', 'timer')
+
+
+def __getattr__(name):
+    if name in _LAZY:
+        module, attr = _LAZY[name]
+        value = getattr(import_module(module, __name__), attr)
+    elif name in _SUBMODULES:
+        value = import_module('.' + name, __name__)
+    else:
+        raise AttributeError("module '{}' has no attribute '{}'"
+                             .format(__name__, name))
+
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY) | set(_SUBMODULES))
 
 __all__ = ['orange', 'slice', 'slices']
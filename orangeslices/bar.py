@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# © 2016 Bernd Busse, The MIT License
+#
+
+from gi.repository import GLib
+import os
+import subprocess
+import sys
+
+
+class LemonBar(object):
+    """lemonbar process fed with one complete frame per write
+
+    The pipe is non-blocking: if lemonbar does not keep up, the rest of a
+    partially written frame is finished first and only the newest of all
+    frames produced in the meantime follows it.
+
+    Click actions printed by lemonbar are read on the main loop and passed
+    to `on_action` together with the monotonic time they were received.
+    """
+
+    def __init__(self, cmd, on_action=None):
+        super().__init__()
+        self.__cmd = cmd
+        self.__proc = None
+        self.__fd = None
+
+        self.__on_action = on_action
+        self.__partial = b''
+        self.__read_id = None
+
+        self.__inflight = None
+        self.__pending = None
+        self.__watch_id = None
+        self.dropped = 0
+
+    def start(self):
+        self.__proc = subprocess.Popen(self.__cmd,
+                                       stdin=subprocess.PIPE,
+                                       stdout=(subprocess.PIPE
+                                               if self.__on_action else
+                                               subprocess.DEVNULL),
+                                       stderr=sys.stderr,
+                                       bufsize=0)
+        self.__fd = self.__proc.stdin.fileno()
+        os.set_blocking(self.__fd, False)
+
+        if self.__on_action is not None:
+            fd = self.__proc.stdout.fileno()
+            os.set_blocking(fd, False)
+            self.__read_id = GLib.io_add_watch(
+                    fd, GLib.PRIORITY_HIGH,
+                    GLib.IO_IN | GLib.IO_HUP | GLib.IO_ERR, self.__readable)
+
+    def __readable(self, fd, condition):
+        received = GLib.get_monotonic_time()
+
+        try:
+            data = os.read(fd, 4096)
+        except BlockingIOError:
+            return True
+        except OSError:
+            data = b''
+
+        if len(data) == 0:
+            self.__read_id = None
+            return False
+
+        lines = (self.__partial + data).split(b'\n')
+        self.__partial = lines.pop()
+        for line in lines:
+            if len(line) > 0:
+                self.__on_action(line.decode('utf-8', 'replace'), received)
+
+        return True
+
+    def poll(self):
+        """return the exit code of lemonbar, `None` while it is running"""
+        if self.__proc is None:
+            return None
+        return self.__proc.poll()
+
+    def write(self, frame):
+        data = frame.encode('utf-8')
+
+        if self.__inflight is not None or self.__pending is not None:
+            # lemonbar is busy, replace the frame waiting for it
+            if self.__pending is not None:
+                self.dropped += 1
+            self.__pending = data
+            return
+
+        self.__send(data)
+        if self.__inflight is not None or self.__pending is not None:
+            self.__watch_id = GLib.io_add_watch(
+                    self.__fd, GLib.PRIORITY_DEFAULT,
+                    GLib.IO_OUT | GLib.IO_HUP | GLib.IO_ERR, self.__writable)
+
+    def __send(self, data, started=False):
+        try:
+            written = os.write(self.__fd, data)
+        except BlockingIOError:
+            written = 0
+        except BrokenPipeError:
+            return
+
+        if written == 0 and not started:
+            # nothing written yet, may still be replaced by a newer frame
+            self.__pending = data
+        elif written < len(data):
+            # the rest of this frame has to follow before anything else
+            self.__inflight = memoryview(data)[written:]
+
+    def __writable(self, fd, condition):
+        if condition & (GLib.IO_HUP | GLib.IO_ERR):
+            self.__watch_id = None
+            return False
+
+        if self.__inflight is not None:
+            data = self.__inflight
+            self.__inflight = None
+            self.__send(data, started=True)
+
+        if self.__inflight is None and self.__pending is not None:
+            data = self.__pending
+            self.__pending = None
+            self.__send(data)
+
+        if self.__inflight is not None or self.__pending is not None:
+            return True
+
+        self.__watch_id = None
+        return False
+
+    def stop(self):
+        if self.__watch_id is not None:
+            GLib.source_remove(self.__watch_id)
+            self.__watch_id = None
+        if self.__read_id is not None:
+            GLib.source_remove(self.__read_id)
+            self.__read_id = None
+
+        if self.__proc is None:
+            return
+
+        try:
+            self.__proc.terminate()
+            try:
+                self.__proc.wait(10)
+            except subprocess.TimeoutExpired:
+                self.__proc.kill()
+        except ProcessLookupError:
+            pass
+
+        try:
+            self.__proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        if self.__proc.stdout is not None:
+            self.__proc.stdout.close()
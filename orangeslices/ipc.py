@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# © 2016 Bernd Busse, The MIT License
+#
+
+from gi.repository import GLib
+import errno
+import os
+import socket
+import stat
+import sys
+import traceback
+
+READ_SIZE = 65536
+MAX_LINE_LENGTH = 65536
+
+
+class UnixServer(object):
+    """line based unix socket server on the main loop
+
+    `on_line` is called with every complete line a client sends, a string
+    it returns is sent back to that client. Clients may keep the connection
+    open and send any number of lines.
+    """
+
+    def __init__(self, path, on_line):
+        super().__init__()
+        self.__path = path
+        self.__on_line = on_line
+        self.__sock = None
+        self.__bound = None
+        self.__watch_id = None
+        self.__clients = {}
+
+    @property
+    def path(self):
+        return self.__path
+
+    def start(self):
+        if os.path.exists(self.__path):
+            self.__remove_stale()
+
+        self.__sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.__sock.bind(self.__path)
+        info = os.stat(self.__path)
+        self.__bound = (info.st_dev, info.st_ino)
+        self.__sock.listen(16)
+        self.__sock.setblocking(False)
+        self.__watch_id = GLib.io_add_watch(self.__sock.fileno(),
+                                            GLib.PRIORITY_DEFAULT,
+                                            GLib.IO_IN, self.__accept)
+
+    def close(self):
+        for fd in list(self.__clients):
+            self.__drop(fd)
+
+        if self.__watch_id is not None:
+            GLib.source_remove(self.__watch_id)
+            self.__watch_id = None
+        if self.__sock is not None:
+            self.__sock.close()
+            self.__sock = None
+            # the path may belong to a newer instance by now
+            try:
+                info = os.stat(self.__path)
+                if (info.st_dev, info.st_ino) == self.__bound:
+                    os.unlink(self.__path)
+            except FileNotFoundError:
+                pass
+            self.__bound = None
+
+    def __remove_stale(self):
+        try:
+            if not stat.S_ISSOCK(os.lstat(self.__path).st_mode):
+                raise OSError(errno.EEXIST, "'{}' exists and is not a socket"
+                              .format(self.__path))
+        except FileNotFoundError:
+            return
+
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.__path)
+        except ConnectionRefusedError:
+            # a stale socket left behind by a previous run
+            os.unlink(self.__path)
+            return
+        except FileNotFoundError:
+            return
+        finally:
+            probe.close()
+
+        raise OSError(errno.EADDRINUSE, "Socket '{}' is in use by another "
+                      "process".format(self.__path))
+
+    def __accept(self, fd, condition):
+        while True:
+            try:
+                conn, _ = self.__sock.accept()
+            except (BlockingIOError, InterruptedError):
+                return True
+            except OSError:
+                traceback.print_exc(file=sys.stderr)
+                sys.stderr.flush()
+                return True
+
+            conn.setblocking(False)
+            watch_id = GLib.io_add_watch(
+                    conn.fileno(), GLib.PRIORITY_DEFAULT,
+                    GLib.IO_IN | GLib.IO_HUP | GLib.IO_ERR, self.__readable)
+            self.__clients[conn.fileno()] = [conn, b'', watch_id]
+
+    def __readable(self, fd, condition):
+        client = self.__clients.get(fd)
+        if client is None:
+            return False
+        conn = client[0]
+
+        try:
+            data = conn.recv(READ_SIZE)
+        except BlockingIOError:
+            return True
+        except OSError:
+            data = b''
+
+        if len(data) == 0:
+            # connection closed, a last line may lack its newline
+            if len(client[1]) > 0:
+                self.__handle(conn, client[1])
+            self.__drop(fd, remove=False)
+            return False
+
+        lines = (client[1] + data).split(b'\n')
+        client[1] = lines.pop()
+        if len(client[1]) > MAX_LINE_LENGTH:
+            sys.stderr.write("Dropping client sending overlong lines\n")
+            sys.stderr.flush()
+            self.__drop(fd, remove=False)
+            return False
+
+        for line in lines:
+            if not self.__handle(conn, line):
+                self.__drop(fd, remove=False)
+                return False
+
+        return True
+
+    def __handle(self, conn, line):
+        try:
+            reply = self.__on_line(line.decode('utf-8', 'replace'))
+        except Exception:
+            traceback.print_exc(file=sys.stderr)
+            sys.stderr.flush()
+            return True
+
+        if reply is None:
+            return True
+
+        # replies are short, a client not reading them is dropped
+        data = reply.encode('utf-8')
+        try:
+            return conn.send(data) == len(data)
+        except OSError:
+            return False
+
+    def __drop(self, fd, remove=True):
+        conn, _, watch_id = self.__clients.pop(fd)
+        if remove:
+            GLib.source_remove(watch_id)
+        conn.close()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# © 2016 Bernd Busse, The MIT License
+#
+
+"""lemonbar markup emitted from runs of equally styled text
+
+A run is a tuple `(fg, bg, hl, underline, overline, action, text)` with
+colors given as `slice.Color` or `None` for the bar defaults. Lines are
+built while tracking the attributes lemonbar has set, so only the tags
+that actually change are written and runs of the same style merge into
+one piece of text.
+"""
+
+FG_RESET = "%{F-}"
+BG_RESET = "%{B-}"
+HL_RESET = "%{U-}"
+
+UNDERLINE = {True: "%{+u}", False: "%{-u}"}
+OVERLINE = {True: "%{+o}", False: "%{-o}"}
+
+ACTION_BEGIN = "%{{A:{:s}:}}"
+ACTION_END = "%{A}"
+
+# the state lemonbar starts every line with
+DEFAULT_STATE = (None, None, None, False, False)
+
+
+def emit(runs, state, output):
+    """append the markup of `runs` drawn after `state` to `output`
+
+    Returns the state after the last run.
+    """
+    fg, bg, hl, under, over = state
+
+    for rfg, rbg, rhl, runder, rover, action, text in runs:
+        if rfg is not fg:
+            output.append(FG_RESET if rfg is None else rfg.fg)
+            fg = rfg
+        if rbg is not bg:
+            output.append(BG_RESET if rbg is None else rbg.bg)
+            bg = rbg
+        # the line color only matters while a line is drawn
+        if (runder or rover) and rhl is not hl:
+            output.append(HL_RESET if rhl is None else rhl.hl)
+            hl = rhl
+        if runder != under:
+            output.append(UNDERLINE[runder])
+            under = runder
+        if rover != over:
+            output.append(OVERLINE[rover])
+            over = rover
+
+        if action is not None:
+            output.append(ACTION_BEGIN.format(action))
+            output.append(text)
+            output.append(ACTION_END)
+        else:
+            output.append(text)
+
+    return fg, bg, hl, under, over
+
+
+def reset(state):
+    """return the tags restoring the defaults after `state`"""
+    fg, bg, hl, under, over = state
+
+    tags = []
+    if fg is not None:
+        tags.append(FG_RESET)
+    if bg is not None:
+        tags.append(BG_RESET)
+    if hl is not None:
+        tags.append(HL_RESET)
+    if under:
+        tags.append(UNDERLINE[False])
+    if over:
+        tags.append(OVERLINE[False])
+
+    return ''.join(tags)
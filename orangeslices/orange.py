@@ -4,43 +4,58 @@
 # © 2016 Bernd Busse, The MIT License
 #
 
-from enum import Enum
+from collections import deque
 from gi.repository import GObject, GLib
+import getopt
 import shlex
-import subprocess
 import sys
 import os
-import xcffib as xcb
-from xcffib import randr
+from threading import Lock
+import traceback
 
+from . import bar
+from . import ipc
+from . import markup
+from . import outputs as topology
 from . import slice
+from . import stats
+from . import timer
 
-# LemonBar ignoring fast input: See https://github.com/LemonBoy/bar/issues/107
-HACK_107 = True
-if HACK_107:
-    from time import time
+# frames replace each other while lemonbar is busy, this only bounds the
+# work done under event storms
+MAX_FPS = 30
 
 AL_LEFT = slice.ALIGN_LEFT
 AL_CENTER = slice.ALIGN_CENTER
 AL_RIGHT = slice.ALIGN_RIGHT
 
-COLOR_RESET = "%{F-}%{B-}%{U-}"
-ATTR_RESET = "%{-u}%{-o}"
-
-FMT_COLOR_FG = "%{{F{:s}}}"
-FMT_COLOR_BG = "%{{B{:s}}}"
-FMT_COLOR_HL = "%{{U{:s}}}"
+ALIGN_TAGS = {AL_LEFT: "%{l}",
+              AL_CENTER: "%{c}",
+              AL_RIGHT: "%{r}"}
 
 LEMONBAR_EXEC = "/usr/bin/lemonbar"
 LEMONBAR_ARGS = ""
+# lemonbar only keeps 10 clickable areas unless told otherwise with `-a`
+CLICKABLE_AREAS = 128
+# options of lemonbar, as passed to getopt()
+LEMONBAR_OPTIONS = "hg:o:bdf:a:pu:B:F:U:n:"
+
+
+OrangeStyle = slice.OrangeStyle
+
 
+def has_option(args, option):
+    """check if lemonbar `args` set `option`, skipping option values"""
+    try:
+        options, _ = getopt.getopt(args, LEMONBAR_OPTIONS)
+    except getopt.GetoptError:
+        # lemonbar will complain itself, leave the arguments alone
+        return True
 
-class OrangeStyle(Enum):
-    STYLE_BLOCKS = 'blocks'
-    STYLE_POWERLINE = 'powerline'
+    return any(name == option for name, _ in options)
 
-BLOCKS = OrangeStyle.STYLE_BLOCKS
-POWERLINE = OrangeStyle.STYLE_POWERLINE
+BLOCKS = slice.STYLE_BLOCKS
+POWERLINE = slice.STYLE_POWERLINE
 
 
 class Orange(GObject.GObject):
@@ -49,164 +64,429 @@ class Orange(GObject.GObject):
             }
 
     def __init__(self, style=BLOCKS, lemonbar_exec=LEMONBAR_EXEC,
-                 lemonbar_args=LEMONBAR_ARGS):
+                 lemonbar_args=LEMONBAR_ARGS, max_fps=MAX_FPS, outputs=None,
+                 mirror=False, stats_file=None, stats_socket=None,
+                 stats_interval=10, multibar=False, bar_height=None,
+                 output_args=None):
         super().__init__()
         self._slices = []
         self.is_running = False
+        self.style = style
 
         if isinstance(lemonbar_args, str):
             lemonbar_args = shlex.split(lemonbar_args)
+        if not has_option(lemonbar_args, '-a'):
+            # e.g. every workspace of I3ws is clickable
+            lemonbar_args = (list(lemonbar_args) +
+                             ['-a', str(CLICKABLE_AREAS)])
         self.__bar_cmd = [lemonbar_exec] + lemonbar_args
         self.__outstream = sys.stdout
+        # also print every frame on stdout, for debugging
+        self.__mirror = mirror
 
         self.__started = False
-        self.__bar_exec = None
+        self.__bar = None
+        self.__last_frame = None
+
+        # one lemonbar per output, each only written when its line changed
+        self.__multibar = multibar
+        self.__bar_height = bar_height
+        self.__output_args = output_args
+        self.__bars = {}
+        self.__last_lines = {}
+        # slices shown on each screen, by alignment
+        self.__layout = {}
+        # (runs, state before, markup, state after) per slice and screen
+        self.__fragments = {}
+        # slices by handle, to find the target of a click
+        self.__handles = {}
+
+        # timings in microseconds, frame and queue counters
+        self.__stats = stats.Stats()
+        self.__stats_file = stats_file
+        self.__stats_interval = stats_interval
+        self.__stats_server = None
+        if stats_socket is not None:
+            self.__stats_server = ipc.UnixServer(stats_socket,
+                                                 self.__stats.handle)
+
+        # minimum time between two frames in microseconds
+        if max_fps:
+            self.__frame_interval = int(1000000 / max_fps)
+        else:
+            self.__frame_interval = 0
+        self.__frame_id = None
+        self.__last_draw = 0
+        self.__requested = 0
+
+        # callbacks handed over from other threads
+        self.__queue = deque()
+        self.__queue_lock = Lock()
+        self.__queue_id = None
 
-        # HACK: LemonBar to slow
-        if HACK_107:
-            self.__last_draw = 0
+        # periodic updates of all slices, redrawn once per tick
+        self.__timers = timer.TimerWheel(on_tick=self.__timers_fired)
 
         self.__loop = GLib.MainLoop()
         GLib.threads_init()
 
-        # get number of active X11 outputs
-        X11_DISPLAY = os.environ['DISPLAY']
-        if X11_DISPLAY is None or len(X11_DISPLAY) == 0:
-            raise ValueError("'DISPLAY' variable not set")
+        if outputs is not None:
+            # fixed number of outputs, e.g. when running without X11
+            self.__topology = topology.OutputTopology(
+                    outputs=[topology.Output(str(i), x=i)
+                             for i in range(outputs)])
+        else:
+            # get active X11 outputs
+            X11_DISPLAY = os.environ.get('DISPLAY')
+            if X11_DISPLAY is None or len(X11_DISPLAY) == 0:
+                raise ValueError("'DISPLAY' variable not set")
+
+            self.__topology = topology.OutputTopology(display=X11_DISPLAY)
 
-        self.__outputs = self.__get_outputs(X11_DISPLAY)
+        self.__outputs = [o.screen for o in self.__topology.outputs]
         if len(self.__outputs) == 0:
             raise RuntimeError("Cannot find any X11 outputs")
 
-    def __get_outputs(self, display):
-        outputs = []
-
-        conn = xcb.connect(display=display)
-        ext = conn(randr.key)
-        screen = conn.get_setup().roots[0]
+        self.__topology.connect('changed', self.__outputs_changed)
 
-        info = ext.GetScreenResourcesCurrent(screen.root).reply()
-        for output in info.outputs:
-            info = ext.GetOutputInfo(output, xcb.CurrentTime).reply()
-            if (info.crtc != xcb.XCB_NONE and
-                    info.connection == randr.Connection.Connected):
-                outputs.append(slice.ScreenNumber.from_index(len(outputs)))
+    @property
+    def outputs(self):
+        """active outputs, ordered by position"""
+        return self.__topology.outputs
 
-        return outputs
+    @property
+    def stats(self):
+        """instrumentation of the update and render pipeline"""
+        return self.__stats
 
-    def __render(self, sl, screen):
-        slice_output = ""
-        first_cut = True
-
-        for _, cut in sorted(sl.cuts.items()):
-            if not cut.screen.value & screen:
-                continue
+    @property
+    def timers(self):
+        """scheduler shared by all periodic slices"""
+        return self.__timers
 
-            if not first_cut:
-                slice_output += sl.default_format() + '|'
-            else:
-                first_cut = False
+    def __timers_fired(self):
+        if self.is_running:
+            self.update()
 
-            slice_output += cut.formatted()
-
-        return slice_output
+    def __outputs_changed(self, topo):
+        self.__outputs = [o.screen for o in topo.outputs]
+        self.__layout.clear()
+        self.__fragments.clear()
+        for sl in self._slices:
+            sl.outputs_changed(topo.outputs)
+
+        self.__last_frame = None
+        if self.is_running:
+            if self.__multibar:
+                self.__sync_bars()
+            self.update()
+
+    def __bar_command(self, output):
+        cmd = list(self.__bar_cmd)
+        if output.width > 0:
+            height = str(self.__bar_height) if self.__bar_height else ''
+            cmd += ['-g', '{:d}x{:s}+{:d}+{:d}'.format(output.width, height,
+                                                       output.x, output.y)]
+
+        extra = self.__output_args
+        if callable(extra):
+            extra = extra(output)
+        elif extra is not None:
+            extra = extra.get(output.name)
+        if isinstance(extra, str):
+            extra = shlex.split(extra)
+
+        return cmd + list(extra or [])
+
+    def __sync_bars(self):
+        """start a lemonbar for every new output, stop those of old ones"""
+        outputs = {output.name: output for output in self.__topology.outputs}
+
+        for name, (cmd, lemonbar) in list(self.__bars.items()):
+            if (name not in outputs or
+                    cmd != self.__bar_command(outputs[name])):
+                lemonbar.stop()
+                del self.__bars[name]
+                self.__last_lines.pop(name, None)
+
+        for name, output in outputs.items():
+            if name not in self.__bars:
+                cmd = self.__bar_command(output)
+                lemonbar = bar.LemonBar(cmd, on_action=self.__on_action)
+                lemonbar.start()
+                self.__bars[name] = (cmd, lemonbar)
+
+    def __get_layout(self, screen):
+        try:
+            return self.__layout[screen]
+        except KeyError:
+            pass
 
-    def __draw(self, number, screen):
-        output = {AL_LEFT: [],
+        layout = {AL_LEFT: [],
                   AL_CENTER: [],
                   AL_RIGHT: []}
-
         for sl in self._slices:
-            if not sl.screen.value & screen:
+            if sl.screen & screen:
+                layout[sl.align].append(sl)
+
+        self.__layout[screen] = layout
+        return layout
+
+    def __emit(self, sl, screen, state, output):
+        # the markup of a slice only depends on its runs and the state
+        # left behind by everything before it
+        runs = sl.rendered(screen)
+        key = (sl.handle, screen)
+        cached = self.__fragments.get(key)
+        if cached is None or cached[0] is not runs or cached[1] != state:
+            fragment = []
+            end = markup.emit(runs, state, fragment)
+            cached = (runs, state, ''.join(fragment), end)
+            self.__fragments[key] = cached
+
+        output.append(cached[2])
+        return cached[3]
+
+    def __join(self, slices, screen, align, state, output):
+        powerline = self.style == POWERLINE
+        started = False
+        last = None
+
+        for sl in slices:
+            first, end = sl.edges(screen)
+            if first is None:
                 continue
 
-            output[sl.align].append(self.__render(sl, screen))
+            if not started:
+                output.append(ALIGN_TAGS[align])
+                started = True
+            # arrows between slices, from and to the bar at the open ends
+            if powerline and (last is not None or align != AL_LEFT):
+                state = markup.emit((slice.separator(last, first, align), ),
+                                    state, output)
 
-        left = ''.join(output[AL_LEFT])
-        center = ''.join(output[AL_CENTER])
-        right = ''.join(output[AL_RIGHT])
+            state = self.__emit(sl, screen, state, output)
+            last = end
 
-        self.__write("%{S" + str(number) + "}")
+        if powerline and last is not None and align != AL_RIGHT:
+            state = markup.emit((slice.separator(last, None, align), ),
+                                state, output)
 
-        if len(left) > 0:
-            self.__write("%{l}")
-            self.__write(left)
-        if len(center) > 0:
-            self.__write("%{c}")
-            self.__write(center)
-        if len(right) > 0:
-            self.__write("%{r}")
-            self.__write(right)
+        return state
 
-        self.__write(COLOR_RESET + ATTR_RESET)
+    def __draw(self, number, screen, state, output):
+        layout = self.__get_layout(screen)
 
-    def __write(self, string):
-        try:
-            self.__outstream.write(string)
-        except BrokenPipeError:
-            pass
-        sys.stdout.write(string)
+        if number is not None:
+            # lemonbar only reads a single digit, screens are drawn in order
+            output.append("%{S" + str(number) + "}" if number < 10 else
+                          "%{S+}")
+        for align in (AL_LEFT, AL_CENTER, AL_RIGHT):
+            state = self.__join(layout[align], screen, align, state, output)
 
-    def __flush(self):
-        try:
+        return state
+
+    def __write(self, frame):
+        if self.__bar is not None:
+            self.__bar.write(frame)
+        else:
+            self.__outstream.write(frame)
             self.__outstream.flush()
-        except BrokenPipeError:
-            pass
-        sys.stdout.flush()
+            if self.__outstream is sys.stdout:
+                return
+
+        if self.__mirror:
+            sys.stdout.write(frame)
+            sys.stdout.flush()
 
     def add(self, sl):
         """add slice to output"""
         self._slices.append(sl)
+        self.__handles[sl.handle] = sl
+        self.__layout.clear()
+        self.__fragments.clear()
         sl.initialize(self)
 
+    def __on_action(self, handle, received):
+        sl = self.__handles.get(handle.split('.', 1)[0])
+        if sl is None:
+            sys.stderr.write("Unknown action '{}'\n".format(handle))
+            sys.stderr.flush()
+            return
+
+        try:
+            cut = sl.clicked(handle)
+        except Exception:
+            traceback.print_exc(file=sys.stderr)
+            sys.stderr.flush()
+            return
+        if cut is None:
+            return
+
+        self.__stats.record('action.{}.{}'.format(type(sl).__name__,
+                                                  cut.uid),
+                            GLib.get_monotonic_time() - received)
+
+    def __update_bars(self):
+        written = 0
+        for output in self.__topology.outputs:
+            if output.name not in self.__bars:
+                continue
+
+            start = GLib.get_monotonic_time()
+            line = []
+            state = self.__draw(None, output.screen, markup.DEFAULT_STATE,
+                                line)
+            line.append(markup.reset(state))
+            line.append('\n')
+            line = ''.join(line)
+            rendered = GLib.get_monotonic_time()
+            self.__stats.record('frame.render', rendered - start)
+
+            if line == self.__last_lines.get(output.name):
+                self.__stats.count('lines.unchanged')
+                continue
+            self.__last_lines[output.name] = line
+
+            self.__bars[output.name][1].write(line)
+            if self.__mirror:
+                sys.stdout.write(line)
+                sys.stdout.flush()
+            self.__stats.record('frame.write',
+                                GLib.get_monotonic_time() - rendered)
+            self.__stats.count('lines.written')
+            written += 1
+
+        self.__stats.count('frames.written' if written > 0 else
+                           'frames.unchanged')
+
     def do_update(self, *args):
         """signal handler for the 'update' event"""
+        if len(self.__bars) > 0:
+            self.__update_bars()
+            return
+
+        start = GLib.get_monotonic_time()
+
+        # attributes carry over between screens, reset once at the end
+        output = []
+        state = markup.DEFAULT_STATE
         for i, screen in enumerate(self.__outputs):
-            self.__draw(i, screen.value)
+            state = self.__draw(i, screen, state, output)
+        output.append(markup.reset(state))
+        output.append('\n')
+        frame = ''.join(output)
+        rendered = GLib.get_monotonic_time()
+        self.__stats.record('frame.render', rendered - start)
+
+        # skip frames lemonbar is already showing
+        if frame == self.__last_frame:
+            self.__stats.count('frames.unchanged')
+            return
+        self.__last_frame = frame
+
+        self.__write(frame)
+        self.__stats.record('frame.write',
+                            GLib.get_monotonic_time() - rendered)
+        self.__stats.count('frames.written')
+
+    def post(self, callback, *args):
+        """run `callback` on the main loop, safe to call from any thread"""
+        with self.__queue_lock:
+            self.__queue.append((callback, args))
+            if self.__queue_id is None:
+                self.__queue_id = GLib.idle_add(self.__drain,
+                                                priority=GLib.PRIORITY_DEFAULT)
+
+    def __drain(self):
+        with self.__queue_lock:
+            batch = self.__queue
+            self.__queue = deque()
+            self.__queue_id = None
+
+        self.__stats.record('queue.depth', len(batch))
+        for callback, args in batch:
+            try:
+                callback(*args)
+            except Exception:
+                traceback.print_exc(file=sys.stderr)
+                sys.stderr.flush()
 
-        self.__write('\n')
-        self.__flush()
+        if self.is_running:
+            self.update()
 
-        # HACK: LemonBar too slow
-        if HACK_107:
-            self.__last_draw = time()
+        return False
 
     def update(self):
-        if (self.__bar_exec is not None and
-                self.__bar_exec.poll() is not None):
+        """request a redraw, coalesced with all other pending requests"""
+        if any(lemonbar.poll() is not None for lemonbar in self.__lemonbars()):
             sys.stderr.write("lemonbar terminated, quitting...\n")
             sys.stderr.flush()
             self.stop()
-            return
-
-        # HACK: LemonBar too slow
-        if HACK_107:
-            now = time()
-            if now - self.__last_draw < 0.1:
-                GLib.timeout_add(100, self.update)
-                return False
-            else:
-                self.emit('update', 0)
-                return False
+            return False
+
+        # at most one frame pending, it will pick up the latest state
+        if self.__frame_id is not None:
+            self.__stats.count('frames.coalesced')
+            return False
+
+        self.__requested = GLib.get_monotonic_time()
+        delay = self.__last_draw + self.__frame_interval - self.__requested
+        if delay <= 0:
+            self.__frame_id = GLib.idle_add(self.__frame,
+                                            priority=GLib.PRIORITY_DEFAULT)
         else:
-            self.emit('update', 0)
+            self.__frame_id = GLib.timeout_add(delay // 1000 + 1,
+                                               self.__frame)
+
+        return False
+
+    def __frame(self):
+        self.__frame_id = None
+        self.__last_draw = GLib.get_monotonic_time()
+        self.emit('update', 0)
+        self.__stats.record('frame.latency',
+                            GLib.get_monotonic_time() - self.__requested)
+
+        return False
+
+    def __lemonbars(self):
+        if self.__bar is not None:
+            return [self.__bar]
+        return [lemonbar for _, lemonbar in self.__bars.values()]
 
-    def run(self):
-        """start lemonbar and generate statusline"""
+    def run(self, outstream=None):
+        """start lemonbar and generate statusline
+
+        If `outstream` is given, the statusline is written there instead
+        and no lemonbar is started. With `multibar` one lemonbar is started
+        for every output, placed on it and following hotplug changes.
+        """
         if self.__started:
             raise RuntimeError("Orange already started.")
 
-        # start lemonbar
-        # TODO: handle lemonbar click actions
         self.__started = True
-        self.__bar_exec = subprocess.Popen(self.__bar_cmd,
-                                           stdin=subprocess.PIPE,
-                                           stdout=subprocess.DEVNULL,
-                                           stderr=sys.stderr,
-                                           universal_newlines=True)
+        if outstream is not None:
+            # all screens go to the stream in one line
+            self.__outstream = outstream
+            self.__multibar = False
+        elif self.__multibar:
+            self.__sync_bars()
+        else:
+            # start lemonbar
+            self.__bar = bar.LemonBar(self.__bar_cmd,
+                                      on_action=self.__on_action)
+            self.__bar.start()
+        self.__stats.gauge('bar.dropped', lambda: sum(
+                lemonbar.dropped for lemonbar in self.__lemonbars()))
 
-        self.__outstream = self.__bar_exec.stdin
         self.is_running = True
+        self.__topology.watch()
+        if self.__stats_file is not None:
+            self.__timers.add(self.__stats_interval, self.__stats.dump,
+                              self.__stats_file)
+        if self.__stats_server is not None:
+            self.__stats_server.start()
         self.update()
 
         # start event loop
@@ -220,19 +500,27 @@ class Orange(GObject.GObject):
         self.__cleanup()
 
     def stop(self):
+        if self.__frame_id is not None:
+            GLib.source_remove(self.__frame_id)
+            self.__frame_id = None
+
         self.__loop.quit()
         self.__cleanup()
 
     def __cleanup(self):
         if self.__started and self.is_running:
             self.is_running = False
+            self.__timers.stop()
+            self.__topology.close()
+            if self.__stats_server is not None:
+                self.__stats_server.close()
+            for sl in self._slices:
+                try:
+                    sl.close()
+                except Exception:
+                    traceback.print_exc(file=sys.stderr)
+                    sys.stderr.flush()
 
             # stop lemonbar
-            try:
-                self.__bar_exec.terminate()
-                try:
-                    self.__bar_exec.wait(10)
-                except subprocess.TimeoutExpired:
-                    self.__bar_exec.kill()
-            except ProcessLookupError:
-                pass
+            for lemonbar in self.__lemonbars():
+                lemonbar.stop()
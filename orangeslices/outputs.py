@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# © 2016 Bernd Busse, The MIT License
+#
+
+from gi.repository import GObject, GLib
+
+from . import slice
+
+
+class Output(object):
+    def __init__(self, name, x=0, y=0, width=0, height=0):
+        super().__init__()
+        self.name = name
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+
+        self.index = None
+        self.screen = None
+
+    def geometry(self):
+        return self.x, self.y, self.width, self.height
+
+    def __eq__(self, other):
+        return (isinstance(other, Output) and self.name == other.name and
+                self.geometry() == other.geometry())
+
+    def __repr__(self):
+        return "{}({!r}, {:d}x{:d}+{:d}+{:d})".format(
+                type(self).__name__, self.name,
+                self.width, self.height, self.x, self.y)
+
+
+class OutputTopology(GObject.GObject):
+    """active X11 outputs, ordered by position
+
+    Keeps a connection to the X server and emits 'changed' whenever RandR
+    reports a different set of outputs, e.g. after docking a laptop.
+    A fixed list of `outputs` can be given instead of a `display`.
+    """
+
+    __gsignals__ = {
+            'changed': (GObject.SIGNAL_RUN_FIRST, None, ())
+            }
+
+    def __init__(self, display=None, outputs=None):
+        super().__init__()
+        self.__conn = None
+        self.__watch_id = None
+
+        if outputs is not None:
+            self.__outputs = self.__arrange(outputs)
+            return
+
+        # only needed when talking to X11
+        import xcffib as xcb
+        from xcffib import randr
+
+        self.__conn = xcb.connect(display=display)
+        self.__ext = self.__conn(randr.key)
+        self.__root = self.__conn.get_setup().roots[0].root
+
+        self.__outputs = self.__query()
+
+    @property
+    def outputs(self):
+        return self.__outputs
+
+    def watch(self):
+        """listen for RandR changes on the main loop"""
+        if self.__conn is None or self.__watch_id is not None:
+            return
+
+        from xcffib import randr
+        self.__ext.SelectInput(self.__root,
+                               randr.NotifyMask.ScreenChange |
+                               randr.NotifyMask.CrtcChange |
+                               randr.NotifyMask.OutputChange)
+        self.__conn.flush()
+        self.__watch_id = GLib.io_add_watch(
+                self.__conn.get_file_descriptor(), GLib.PRIORITY_DEFAULT,
+                GLib.IO_IN | GLib.IO_HUP | GLib.IO_ERR, self.__on_event)
+
+    def close(self):
+        if self.__watch_id is not None:
+            GLib.source_remove(self.__watch_id)
+            self.__watch_id = None
+        if self.__conn is not None:
+            self.__conn.disconnect()
+            self.__conn = None
+
+    def refresh(self):
+        outputs = self.__query()
+        if outputs != self.__outputs:
+            self.__outputs = outputs
+            self.emit('changed')
+
+    def __on_event(self, fd, condition):
+        if condition & (GLib.IO_HUP | GLib.IO_ERR):
+            self.__watch_id = None
+            return False
+
+        # handle a burst of notifications at once
+        pending = False
+        while self.__conn.poll_for_event() is not None:
+            pending = True
+
+        if pending:
+            self.refresh()
+
+        return True
+
+    def __query(self):
+        import xcffib as xcb
+        from xcffib import randr
+
+        outputs = []
+
+        info = self.__ext.GetScreenResourcesCurrent(self.__root).reply()
+        for output in info.outputs:
+            info = self.__ext.GetOutputInfo(output, xcb.CurrentTime).reply()
+            if (info.crtc == xcb.XCB_NONE or
+                    info.connection != randr.Connection.Connected):
+                continue
+
+            crtc = self.__ext.GetCrtcInfo(info.crtc, xcb.CurrentTime).reply()
+            name = b''.join(c if isinstance(c, bytes) else bytes([c])
+                            for c in info.name).decode('utf-8', 'replace')
+            outputs.append(Output(name, crtc.x, crtc.y,
+                                  crtc.width, crtc.height))
+
+        return self.__arrange(outputs)
+
+    def __arrange(self, outputs):
+        outputs = sorted(outputs, key=lambda o: (o.y, o.x))
+        for i, output in enumerate(outputs):
+            output.index = i
+            output.screen = slice.ScreenNumber.from_index(i)
+
+        return outputs
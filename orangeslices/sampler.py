@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# © 2016 Bernd Busse, The MIT License
+#
+
+import os
+import time
+
+READ_SIZE = 65536
+
+# slices updated in the same tick share a single read of every source
+MAX_AGE = 0.5
+
+PROC_STAT = '/proc/stat'
+PROC_MEMINFO = '/proc/meminfo'
+PROC_NET_DEV = '/proc/net/dev'
+POWER_SUPPLY = '/sys/class/power_supply'
+
+
+class Source(object):
+    """procfs or sysfs file kept open and re-read from offset 0
+
+    Both regenerate their content on every read at offset 0, so `pread()`
+    on the same descriptor replaces an open, read and close each time.
+    """
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self.__fd = None
+        self.__data = None
+        self.__read_at = None
+
+    def read(self, max_age=MAX_AGE):
+        now = time.monotonic()
+        if self.__read_at is not None and now - self.__read_at < max_age:
+            return self.__data
+
+        if self.__fd is None:
+            self.__fd = os.open(self.path, os.O_RDONLY | os.O_CLOEXEC)
+
+        chunks = []
+        offset = 0
+        try:
+            while True:
+                chunk = os.pread(self.__fd, READ_SIZE, offset)
+                if len(chunk) == 0:
+                    break
+                chunks.append(chunk)
+                offset += len(chunk)
+        except OSError:
+            # e.g. a battery that was removed, open it again next time
+            self.close()
+            raise
+
+        self.__data = b''.join(chunks).decode('ascii', 'replace')
+        self.__read_at = now
+        return self.__data
+
+    def close(self):
+        if self.__fd is not None:
+            os.close(self.__fd)
+            self.__fd = None
+        self.__read_at = None
+
+__sources__ = {}
+
+
+def get_source(path):
+    if path not in __sources__:
+        __sources__[path] = Source(path)
+
+    return __sources__[path]
+
+
+def cpu_times():
+    """return (busy, total) jiffies of all CPUs since boot"""
+    fields = [int(f) for f in get_source(PROC_STAT).read()
+              .split('\n', 1)[0].split()[1:]]
+    # idle and iowait
+    idle = fields[3] + (fields[4] if len(fields) > 4 else 0)
+    # guest time is already part of user and nice
+    total = sum(fields[:8])
+
+    return total - idle, total
+
+
+def meminfo():
+    """return the fields of /proc/meminfo in bytes"""
+    info = {}
+    for line in get_source(PROC_MEMINFO).read().splitlines():
+        name, _, value = line.partition(':')
+        value = value.split()
+        if len(value) > 0:
+            info[name] = int(value[0]) * (1024 if len(value) > 1 else 1)
+
+    return info
+
+
+def net_bytes():
+    """return {interface: (received, transmitted)} in bytes since boot"""
+    interfaces = {}
+    for line in get_source(PROC_NET_DEV).read().splitlines()[2:]:
+        name, _, counters = line.partition(':')
+        counters = counters.split()
+        interfaces[name.strip()] = (int(counters[0]), int(counters[8]))
+
+    return interfaces
+
+
+def power_supply(name, attribute):
+    """return an attribute of a battery or AC adapter, e.g. 'capacity'"""
+    path = os.path.join(POWER_SUPPLY, name, attribute)
+    return get_source(path).read().strip()
+
+
+class Rate(object):
+    """turn a growing counter into a rate per second"""
+
+    def __init__(self):
+        super().__init__()
+        self.__last = None
+        self.__last_time = None
+
+    def update(self, value):
+        now = time.monotonic()
+        rate = 0.0
+        if self.__last is not None and now > self.__last_time:
+            rate = max(0, value - self.__last) / (now - self.__last_time)
+
+        self.__last = value
+        self.__last_time = now
+        return rate
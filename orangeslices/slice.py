@@ -6,11 +6,12 @@
 
 from enum import Enum
 from gi.repository import GLib
+from itertools import count
 import re
+import shlex
 import sys
 import traceback
 
-
 COLOR_FMT = "#{a:s}{r:s}{g:s}{b:s}"
 RE_COLOR_RGB = re.compile("#" + "([0-9A-F])"*3, re.I)
 RE_COLOR_ARGB = re.compile("#" + "([0-9A-F])"*4, re.I)
@@ -18,7 +19,38 @@ RE_COLOR_RRGGBB = re.compile("#" + "([0-9A-F]{2})"*3, re.I)
 RE_COLOR_AARRGGBB = re.compile("#" + "([0-9A-F]{2})"*4, re.I)
 
 
-def SliceColor(color):
+class Color(object):
+    """immutable, interned color with pre-rendered lemonbar tags
+
+    Use `SliceColor()` to get instances, equal colors are the same object.
+    """
+
+    __slots__ = ('value', 'fg', 'bg', 'hl')
+
+    def __init__(self, value):
+        object.__setattr__(self, 'value', value)
+        object.__setattr__(self, 'fg', "%{F" + value + "}")
+        object.__setattr__(self, 'bg', "%{B" + value + "}")
+        object.__setattr__(self, 'hl', "%{U" + value + "}")
+
+    def __setattr__(self, name, value):
+        raise AttributeError("'{}' object is read-only"
+                             .format(type(self).__name__))
+
+    def __str__(self):
+        return self.value
+
+    def __format__(self, spec):
+        return format(self.value, spec)
+
+    def __repr__(self):
+        return "{}({!r})".format(type(self).__name__, self.value)
+
+__colors__ = {}
+__interned__ = {}
+
+
+def _parse_color(color):
     match = RE_COLOR_RGB.fullmatch(color)
     if match is not None:
         return COLOR_FMT.format(a="FF",
@@ -50,6 +82,23 @@ def SliceColor(color):
     raise ValueError("{:s} is not a valid color format".format(color))
 
 
+def SliceColor(color):
+    if isinstance(color, Color):
+        return color
+
+    try:
+        return __colors__[color]
+    except KeyError:
+        pass
+
+    value = _parse_color(color).upper()
+    if value not in __interned__:
+        __interned__[value] = Color(value)
+
+    __colors__[color] = __interned__[value]
+    return __colors__[color]
+
+
 COLOR_WHITE = SliceColor("#FFF")
 COLOR_BLACK = SliceColor("#000")
 COLOR_RED = SliceColor("#F00")
@@ -65,7 +114,48 @@ ALIGN_CENTER = SliceAlignment.ALIGN_CENTER
 ALIGN_RIGHT = SliceAlignment.ALIGN_RIGHT
 
 
-class ScreenNumber(Enum):
+class OrangeStyle(Enum):
+    STYLE_BLOCKS = 'blocks'
+    STYLE_POWERLINE = 'powerline'
+
+STYLE_BLOCKS = OrangeStyle.STYLE_BLOCKS
+STYLE_POWERLINE = OrangeStyle.STYLE_POWERLINE
+
+# powerline arrows, solid between different and thin between equal colors
+ARROW_RIGHT = "\ue0b0"
+ARROW_RIGHT_THIN = "\ue0b1"
+ARROW_LEFT = "\ue0b2"
+ARROW_LEFT_THIN = "\ue0b3"
+
+__separators__ = {}
+
+
+def separator(left, right, align):
+    """return the powerline arrow run between backgrounds `left` and `right`
+
+    `None` stands for the bar background at the start or end of a block.
+    Arrows point away from the aligned edge, in the center both ways.
+    """
+    key = (left, right, align)
+    try:
+        return __separators__[key]
+    except KeyError:
+        pass
+
+    if left is right:
+        arrow = ARROW_LEFT_THIN if align == ALIGN_RIGHT else ARROW_RIGHT_THIN
+        run = (None, left, None, False, False, None, arrow)
+    elif align == ALIGN_RIGHT or left is None:
+        run = (right, left, None, False, False, None, ARROW_LEFT)
+    else:
+        run = (left, right, None, False, False, None, ARROW_RIGHT)
+
+    __separators__[key] = run
+    return run
+
+
+class ScreenNumber(object):
+    """screens are plain integer bitsets, bit `n` selects the n-th output"""
     SCREEN_FIRST = 1 << 0
     SCREEN_SECOND = 1 << 1
     SCREEN_THIRD = 1 << 2
@@ -75,118 +165,198 @@ class ScreenNumber(Enum):
     SCREEN_SEVENTH = 1 << 6
     SCREEN_EIGHTH = 1 << 7
     SCREEN_NINTH = 1 << 8
-    SCREEN_ALL = 0x01FF
-
-    @classmethod
-    def from_index(cls, index):
-        if index == 0:
-            return cls.SCREEN_FIRST
-        elif index == 1:
-            return cls.SCREEN_SECOND
-        elif index == 2:
-            return cls.SCREEN_THIRD
-        elif index == 3:
-            return cls.SCREEN_FOURTH
-        elif index == 4:
-            return cls.SCREEN_FIFTH
-        elif index == 5:
-            return cls.SCREEN_SIXTH
-        elif index == 6:
-            return cls.SCREEN_SEVENTH
-        elif index == 7:
-            return cls.SCREEN_EIGHTH
-        elif index == 8:
-            return cls.SCREEN_NINTH
-        else:
-            return cls.SCREEN_ALL
-
+    SCREEN_ALL = -1
+
+    @staticmethod
+    def from_index(index):
+        return 1 << index
+
+SCREEN_FIRST = ScreenNumber.SCREEN_FIRST
+SCREEN_SECOND = ScreenNumber.SCREEN_SECOND
+SCREEN_THIRD = ScreenNumber.SCREEN_THIRD
+SCREEN_FOURTH = ScreenNumber.SCREEN_FOURTH
+SCREEN_FIFTH = ScreenNumber.SCREEN_FIFTH
+SCREEN_SIXTH = ScreenNumber.SCREEN_SIXTH
+SCREEN_SEVENTH = ScreenNumber.SCREEN_SEVENTH
+SCREEN_EIGHTH = ScreenNumber.SCREEN_EIGHTH
+SCREEN_NINTH = ScreenNumber.SCREEN_NINTH
 SCREEN_ALL = ScreenNumber.SCREEN_ALL
 
 
-class CutContainer(object):
-    FMT = "%{{F{fg:s}}}%{{B{bg:s}}}%{{U{hl:s}}}{attren:s}{text:s}{attrdis:s}"
-    HOOKS = ('text', 'color_fg', 'color_bg', 'color_hl',
-             'urgent', 'underline', 'overline')
+# handles of all slices, lemonbar reports clicks with them
+__slice_ids__ = count()
 
-    def __init__(self, uid, text, color_fg, color_bg, color_hl,
-                 urgent, underline, overline, screen):
-        super().__init__()
-        object.__setattr__(self, 'uid', uid)
-
-        self.text = text
-        self.color_fg = color_fg
-        self.color_bg = color_bg
-        self.color_hl = color_hl
-        self.urgent = urgent
-        self.underline = underline
-        self.overline = overline
-        self.screen = screen
 
-        self.__formatted = text
-        self.__needs_refresh = True
+def spawn(command):
+    """start `command` in the background without waiting for it"""
+    if isinstance(command, str):
+        command = shlex.split(command)
+    GLib.spawn_async(command, flags=GLib.SpawnFlags.SEARCH_PATH)
 
-    def __setattr__(self, name, value):
-        if name == 'uid':
-            raise AttributeError("'{}' object attribute 'uid' is read-only"
-                                 .format(type(self).__name__))
-        if name in CutContainer.HOOKS:
-            self.__needs_refresh = True
 
-        super().__setattr__(name, value)
+def _hooked(name, refresh=True, convert=None):
+    """property that marks the cut as changed when a new value is set"""
+    slot = '_' + name
+
+    def getter(self):
+        return getattr(self, slot)
+
+    def setter(self, value):
+        if convert is not None:
+            value = convert(value)
+        if getattr(self, slot) != value:
+            setattr(self, slot, value)
+            if refresh:
+                self._run = None
+            if self._on_change is not None:
+                # attributes not affecting the format move the cut instead
+                self._on_change(self, not refresh)
+
+    return property(getter, setter)
+
 
-    def formatted(self):
-        if self.__needs_refresh:
-            if self.urgent:
+class CutContainer(object):
+    __slots__ = ('_uid', '_text', '_color_fg', '_color_bg', '_color_hl',
+                 '_urgent', '_underline', '_overline', '_screen',
+                 '_action', '_handle', '_on_change', '_run')
+
+    def __init__(self, uid, text, color_fg, color_bg, color_hl,
+                 urgent, underline, overline, screen, action=None,
+                 handle=None, on_change=None):
+        self._uid = uid
+        self._text = text
+        self._color_fg = SliceColor(color_fg)
+        self._color_bg = SliceColor(color_bg)
+        self._color_hl = SliceColor(color_hl)
+        self._urgent = urgent
+        self._underline = underline
+        self._overline = overline
+        self._screen = screen
+        self._action = action
+        self._handle = handle
+
+        self._on_change = on_change
+        self._run = None
+
+    uid = property(lambda self: self._uid)
+    handle = property(lambda self: self._handle)
+
+    text = _hooked('text')
+    color_fg = _hooked('color_fg', convert=SliceColor)
+    color_bg = _hooked('color_bg', convert=SliceColor)
+    color_hl = _hooked('color_hl', convert=SliceColor)
+    urgent = _hooked('urgent')
+    underline = _hooked('underline')
+    overline = _hooked('overline')
+    screen = _hooked('screen', refresh=False)
+    action = _hooked('action')
+
+    def update(self, text=None, color_fg=None, color_bg=None, color_hl=None,
+               urgent=None, underline=None, overline=None, screen=None,
+               action=None):
+        """set several attributes at once, `None` keeps the current value"""
+        refresh = False
+        if text is not None and text != self._text:
+            self._text = text
+            refresh = True
+        if color_fg is not None:
+            color_fg = SliceColor(color_fg)
+            if color_fg is not self._color_fg:
+                self._color_fg = color_fg
+                refresh = True
+        if color_bg is not None:
+            color_bg = SliceColor(color_bg)
+            if color_bg is not self._color_bg:
+                self._color_bg = color_bg
+                refresh = True
+        if color_hl is not None:
+            color_hl = SliceColor(color_hl)
+            if color_hl is not self._color_hl:
+                self._color_hl = color_hl
+                refresh = True
+        if urgent is not None and urgent != self._urgent:
+            self._urgent = urgent
+            refresh = True
+        if underline is not None and underline != self._underline:
+            self._underline = underline
+            refresh = True
+        if overline is not None and overline != self._overline:
+            self._overline = overline
+            refresh = True
+        if action is not None and action != self._action:
+            self._action = action
+            refresh = True
+
+        if screen is not None and screen != self._screen:
+            self._screen = screen
+            if self._on_change is not None:
+                self._on_change(self, True)
+
+        if refresh:
+            self._run = None
+            if self._on_change is not None:
+                self._on_change(self, False)
+
+    def background(self):
+        """return the background color the cut is drawn with"""
+        return COLOR_RED if self._urgent else self._color_bg
+
+    def run(self):
+        """return the cut as a run of styled text, see `markup`"""
+        if self._run is None:
+            if self._urgent:
                 fg = COLOR_WHITE
                 bg = COLOR_RED
                 hl = COLOR_WHITE
             else:
-                fg = self.color_fg
-                bg = self.color_bg
-                hl = self.color_hl
-
-            if self.underline or self.overline:
-                attren = ''.join(['%{',
-                                  '+' if self.underline else '-', 'u}%{',
-                                  '+' if self.overline else '-', 'o}'])
-                attrdis = "%{-u}%{-o}"
-            else:
-                attren = ""
-                attrdis = ""
+                fg = self._color_fg
+                bg = self._color_bg
+                hl = self._color_hl
 
-            opts = {'text': self.text, 'fg': fg, 'bg': bg, 'hl': hl,
-                    'attren': attren, 'attrdis': attrdis}
-            self.__formatted = CutContainer.FMT.format(**opts)
-            self.__needs_refresh = False
+            action = self._handle if self._action is not None else None
+            self._run = (fg, bg, hl, bool(self._underline),
+                         bool(self._overline), action, self._text)
 
-        return self.__formatted
+        return self._run
 
 
 class Slice(object):
-    DEFAULT_FMT = "%{{F{fg:s}}}%{{B{bg:s}}}%{{U{hl:s}}}"
-
     def __init__(self, color_fg=COLOR_WHITE, color_bg=COLOR_BLACK,
                  color_hl=COLOR_WHITE, align=ALIGN_LEFT,
-                 overline=False, underline=False, screen=SCREEN_ALL):
+                 overline=False, underline=False, screen=SCREEN_ALL,
+                 action=None):
         super().__init__()
         self.align = align
         self.screen = screen
         self.cuts = {}
+        # prefix of the handles lemonbar reports for clicks on our cuts
+        self.handle = 's{:d}'.format(next(__slice_ids__))
+        self.__stats_key = 'update.{}.{}'.format(type(self).__name__,
+                                                 self.handle)
 
         self._color_fg = SliceColor(color_fg)
         self._color_bg = SliceColor(color_bg)
         self._color_hl = SliceColor(color_hl)
         self._underline = underline
         self._overline = overline
+        self._action = action
 
         self._manager = None
+        self.__style = STYLE_BLOCKS
+        self.__cut_ids = count()
+        self.__actions = {}
+
+        # cuts in order, visible cuts and output per screen
+        self.__order = None
+        self.__visible = {}
+        self.__rendered = {}
 
-        self.__default_formatted = Slice.DEFAULT_FMT.format(fg=self._color_fg,
-                                                            bg=self._color_bg,
-                                                            hl=self._color_hl)
+        self.__separator = (self._color_fg, self._color_bg, self._color_hl,
+                            False, False, None, '|')
 
     def _add_cut(self, uid, text, fg=None, bg=None, hl=None,
-                 urgent=False, under=None, over=None, screen=None, index=None):
+                 urgent=False, under=None, over=None, screen=None, index=None,
+                 action=None):
         if index is None:
             index = uid
         if fg is None:
@@ -203,45 +373,67 @@ class Slice(object):
 
         if screen is None:
             screen = self.screen
+        if action is None:
+            action = self._action
+
+        if index in self.cuts:
+            self.__actions.pop(self.cuts[index].handle, None)
 
         text = ' ' + text.strip() + ' '
-        cut = CutContainer(uid, text, fg, bg, hl, urgent, under, over, screen)
+        handle = '{:s}.{:d}'.format(self.handle, next(self.__cut_ids))
+        cut = CutContainer(uid, text, fg, bg, hl, urgent, under, over, screen,
+                           action=action, handle=handle,
+                           on_change=self.__cut_changed)
         self.cuts[index] = cut
+        self.__actions[handle] = cut
+        self._invalidate()
 
     def _get_cut(self, uid):
         return self.cuts[uid]
 
     def _del_cut(self, uid):
-        self.cuts.pop(uid)
+        cut = self.cuts.pop(uid)
+        self.__actions.pop(cut.handle, None)
+        self._invalidate()
 
-    def _update_cut(self, uid, text=None, fg=None, bg=None, hl=None,
-                    urgent=None, under=None, over=None, screen=None):
-        cut = self.cuts[uid]
+    def _clear_cuts(self):
+        self.cuts.clear()
+        self.__actions.clear()
+        self._invalidate()
 
+    def _update_cut(self, uid, text=None, fg=None, bg=None, hl=None,
+                    urgent=None, under=None, over=None, screen=None,
+                    action=None):
         if text is not None:
-            cut.text = ' ' + text.strip() + ' '
-        if fg is not None:
-            cut.color_fg = fg
-        if bg is not None:
-            cut.color_bg = bg
-        if hl is not None:
-            cut.color_hl = hl
-
-        if urgent is not None:
-            cut.urgent = urgent
-        if under is not None:
-            cut.underline = under
-        if over is not None:
-            cut.overline = over
-
-        if screen is not None:
-            cut.screen = screen
+            text = ' ' + text.strip() + ' '
+
+        self.cuts[uid].update(text=text, color_fg=fg, color_bg=bg,
+                              color_hl=hl, urgent=urgent, underline=under,
+                              overline=over, screen=screen, action=action)
+
+    def clicked(self, handle):
+        """run the action of the cut behind `handle`
+
+        Callables are called with the cut, anything else is started as a
+        command. Returns the cut, `None` if it is gone by now.
+        """
+        cut = self.__actions.get(handle)
+        if cut is None or cut.action is None:
+            return None
+
+        if callable(cut.action):
+            cut.action(cut)
+        else:
+            spawn(cut.action)
+
+        return cut
 
     def _stop_on_exception(self, message=None):
         if message is not None:
             sys.stderr.write(str(message) + "\n")
 
-        traceback.print_exc(file=sys.stderr)
+        if sys.exc_info()[0] is not None:
+            traceback.print_exc(file=sys.stderr)
         sys.stderr.flush()
 
         if (self._manager is not None and
@@ -250,15 +442,103 @@ class Slice(object):
 
     def initialize(self, manager):
         self._manager = manager
-        self.update()
+        self.__style = manager.style
+        self._timed(self.update)
+
+    def close(self):
+        """called when the manager stops, release what `initialize` set up"""
+        pass
+
+    def _post(self, callback, *args):
+        """run `callback` on the main loop, may be called from any thread"""
+        if self._manager is not None:
+            self._manager.post(callback, *args)
+        else:
+            callback(*args)
+
+    def _timed(self, callback, *args):
+        """run `callback`, its duration counts as update time of the slice"""
+        if self._manager is None:
+            return callback(*args)
+
+        start = GLib.get_monotonic_time()
+        try:
+            return callback(*args)
+        finally:
+            self._manager.stats.record(self.__stats_key,
+                                       GLib.get_monotonic_time() - start)
 
     def propagate(self):
         if (self._manager is not None and
                 self._manager.is_running):
             self._manager.update()
 
-    def default_format(self):
-        return self.__default_formatted
+    def outputs_changed(self, outputs):
+        """called with the new list of outputs after a hotplug event"""
+        pass
+
+    def _invalidate(self):
+        """drop all cached output, called whenever cuts are added or removed"""
+        self.__order = None
+        self.__visible.clear()
+        self.__rendered.clear()
+
+    def __cut_changed(self, cut, moved):
+        if moved:
+            self.__visible.clear()
+            self.__rendered.clear()
+            return
+
+        # only the screens showing this cut need to be rendered again
+        for screen in [s for s in self.__rendered if s & cut.screen]:
+            del self.__rendered[screen]
+
+    def visible(self, screen):
+        """return the cuts shown on `screen` in order"""
+        try:
+            return self.__visible[screen]
+        except KeyError:
+            pass
+
+        if self.__order is None:
+            self.__order = [cut for _, cut in sorted(self.cuts.items())]
+
+        visible = [cut for cut in self.__order if cut.screen & screen]
+        self.__visible[screen] = visible
+        return visible
+
+    def rendered(self, screen):
+        """return the (cached) runs of all cuts visible on `screen`
+
+        A new list is returned whenever the output changed, so callers
+        may cache what they made of it by identity.
+        """
+        try:
+            return self.__rendered[screen]
+        except KeyError:
+            pass
+
+        output = []
+        last = None
+        for cut in self.visible(screen):
+            if last is not None:
+                if self.__style == STYLE_POWERLINE:
+                    output.append(separator(last.background(),
+                                            cut.background(), self.align))
+                else:
+                    output.append(self.__separator)
+            output.append(cut.run())
+            last = cut
+
+        self.__rendered[screen] = output
+        return output
+
+    def edges(self, screen):
+        """return the backgrounds of the first and last cut on `screen`"""
+        visible = self.visible(screen)
+        if len(visible) == 0:
+            return None, None
+        return visible[0].background(), visible[-1].background()
 
     def update(self):
         raise NotImplementedError("update() needs to be implemented by {}"
@@ -266,22 +546,29 @@ class Slice(object):
 
 
 class IntervalSlice(Slice):
-    def __init__(self, interval=5, **kwargs):
+    """slice updated every `interval` seconds
+
+    With `aligned` the updates happen on multiples of `interval` in local
+    time, e.g. at every full minute, instead of counting from the start.
+    """
+
+    def __init__(self, interval=5, aligned=False, **kwargs):
         super().__init__(**kwargs)
         if not isinstance(interval, int):
             raise ValueError(
                     "'interval' must be of type int not {}"
                     .format(interval.__class__.__name__))
         self.__interval = interval
+        self.__aligned = aligned
 
     def initialize(self, manager):
-        self.__timeout_id = GLib.timeout_add_seconds(self.__interval,
-                                                     self._timeout)
+        self.__timer = manager.timers.add(self.__interval, self._timeout,
+                                          aligned=self.__aligned)
         super().initialize(manager)
 
     def _timeout(self):
-        self.update()
-        self.propagate()
+        # the timer wheel redraws once for all slices due in this tick
+        self._timed(self.update)
 
         return True
 
@@ -6,9 +6,39 @@
 
 """Not yet implemented"""
 
-from .clock import Clock
-from .commands import Command
-from .i3wm import I3ws, I3title
-from .separator import Separator
+from importlib import import_module
 
-__all__ = ['clock', 'commands', 'i3wm', 'separator']
+# slice: module, so e.g. i3ipc is only imported if an i3 slice is used
+REGISTRY = {
+    'BatterySlice': '.system',
+    'Clock': '.clock',
+    'Command': '.commands',
+    'CpuSlice': '.system',
+    'FileWatch': '.filewatch',
+    'I3ws': '.i3wm',
+    'I3title': '.i3wm',
+    'MemorySlice': '.system',
+    'NetworkSlice': '.system',
+    'Push': '.push',
+    'Separator': '.separator',
+}
+
+
+def __getattr__(name):
+    if name in REGISTRY:
+        value = getattr(import_module(REGISTRY[name], __name__), name)
+    elif name in __all__:
+        value = import_module('.' + name, __name__)
+    else:
+        raise AttributeError("module '{}' has no attribute '{}'"
+                             .format(__name__, name))
+
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(REGISTRY) | set(__all__))
+
+__all__ = ['clock', 'commands', 'filewatch', 'i3wm', 'push', 'separator',
+           'system']
@@ -7,13 +7,23 @@
 import time
 
 from orangeslices import slice
+from orangeslices import timer
 
 DEFAULT_DATETIME_FMT = "%H:%M"
 
 
 class Clock(slice.IntervalSlice):
-    def __init__(self, timefmt=DEFAULT_DATETIME_FMT, **kwargs):
-        super().__init__(**kwargs)
+    """current time, redrawn exactly when `timefmt` changes
+
+    Without an `interval` it is derived from the directives in `timefmt`,
+    e.g. once a minute for "%H:%M".
+    """
+
+    def __init__(self, timefmt=DEFAULT_DATETIME_FMT, interval=None,
+                 aligned=True, **kwargs):
+        if interval is None:
+            interval = timer.granularity(timefmt)
+        super().__init__(interval=interval, aligned=aligned, **kwargs)
         self.__timefmt = timefmt
 
         self._add_cut(0, "")
@@ -5,12 +5,14 @@
 #
 
 from enum import Enum
+from functools import partial
 from gi.repository import GLib
+import fcntl
+import os
 import shlex
+import signal
 import subprocess
-import select
-from threading import Thread
-from collections import deque
+import sys
 
 from orangeslices import slice
 
@@ -24,47 +26,202 @@ ONESHOT = CommandType.TYPE_ONESHOT
 PERIODIC = CommandType.TYPE_PERIODIC
 PERSISTENT = CommandType.TYPE_PERSISTENT
 
+DEFAULT_TIMEOUT = 10
+MAX_LINE_LENGTH = 4096
+READ_SIZE = 4096
 
-def popen_background(cmd, callback, on_error):
+
+def set_nonblocking(fd):
+    flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+    fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+
+def watch_stream(stream, callback, *args):
+    """call `callback(fd, condition, stream, *args)` on new data"""
+    set_nonblocking(stream.fileno())
+    return GLib.io_add_watch(stream.fileno(), GLib.PRIORITY_DEFAULT,
+                             GLib.IO_IN | GLib.IO_HUP | GLib.IO_ERR,
+                             callback, stream, *args)
+
+
+def read_available(fd):
+    """read everything currently available from a non-blocking `fd`"""
+    chunks = []
     try:
-        proc_stderr = deque([], 15)
-        proc = subprocess.Popen(cmd, shell=False,
-                                universal_newlines=True,
-                                stdout=subprocess.PIPE,
-                                stderr=subprocess.PIPE)
-
-        events = select.POLLIN | select.POLLPRI | select.POLLHUP
-        fn_stdout = proc.stdout.fileno()
-        fn_stderr = proc.stderr.fileno()
-
-        poll = select.poll()
-        poll.register(proc.stdout, events)
-        poll.register(proc.stderr, events)
-
-        while proc.poll() is None:
-            for fd, event in poll.poll():
-                if event & select.POLLHUP and proc.poll() is None:
-                    try:
-                        _, stderr = proc.communicate(timeout=5)
-                        proc_stderr.append(stderr.rstrip())
-                    except subprocess.TimeoutExpired:
-                        proc.kill()
-                else:
-                    if fd == fn_stdout:
-                        callback(proc.stdout.readline().rstrip())
-                    elif fd == fn_stderr:
-                        proc_stderr.append(proc.stderr.readline().rstrip())
-
-        if proc.returncode != 0:
-            raise subprocess.CalledProcessError(proc.returncode, ' '.join(cmd),
-                                                stderr='\n'.join(proc_stderr))
-    except:
-        on_error("Backgroundprocess '" + ' '.join(cmd) + "' failed.")
+        while True:
+            data = os.read(fd, READ_SIZE)
+            if not data:
+                return chunks, True
+            chunks.append(data)
+    except BlockingIOError:
+        return chunks, False
+    except OSError:
+        return chunks, True
+
+
+class popen_async(object):
+    """run `cmd` without blocking the main loop
+
+    `callback` is called with the complete output once the process exited
+    successfully, `on_error` with a message if it failed or timed out.
+    """
+
+    def __init__(self, cmd, callback, on_error, timeout=None):
+        super().__init__()
+        self._callback = callback
+        self._on_error = on_error
+
+        self.__cmd = cmd
+        self.__stdout = []
+        self.__stderr = []
+        self.__timed_out = False
+        self.__timeout_id = None
+
+        self.proc = subprocess.Popen(cmd, shell=False,
+                                     stdin=subprocess.DEVNULL,
+                                     stdout=subprocess.PIPE,
+                                     stderr=subprocess.PIPE,
+                                     start_new_session=True)
+
+        self.__streams = [self.proc.stdout, self.proc.stderr]
+        watch_stream(self.proc.stdout, self.__read, self.__stdout)
+        watch_stream(self.proc.stderr, self.__read, self.__stderr)
+
+        if timeout:
+            self.__timeout_id = GLib.timeout_add_seconds(timeout, self.__kill)
+
+    def __read(self, fd, condition, stream, buf):
+        chunks, eof = read_available(fd)
+        buf.extend(chunks)
+        if not eof:
+            return True
+
+        stream.close()
+        self.__streams.remove(stream)
+        if len(self.__streams) == 0:
+            self.__wait()
+
+        return False
+
+    def __wait(self):
+        if self.proc.poll() is None:
+            # pipes closed, but process still running
+            GLib.timeout_add(10, self.__wait)
+            return False
+
+        if self.__timeout_id is not None:
+            GLib.source_remove(self.__timeout_id)
+            self.__timeout_id = None
+
+        stdout = b''.join(self.__stdout).decode('utf-8', 'replace')
+        stderr = b''.join(self.__stderr).decode('utf-8', 'replace')
+
+        if self.__timed_out:
+            self._on_error("Process '{}' timed out."
+                           .format(' '.join(self.__cmd)))
+        elif self.proc.returncode != 0:
+            self._on_error("Process '{}' failed with exit code {:d}: {}"
+                           .format(' '.join(self.__cmd),
+                                   self.proc.returncode, stderr.rstrip()))
+        else:
+            self._callback(stdout)
+
+        return False
+
+    def __kill(self):
+        self.__timeout_id = None
+        self.__timed_out = True
+        try:
+            # also get rid of children still holding our pipes
+            os.killpg(self.proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+        return False
+
+
+class popen_lines(object):
+    """read the output of a long running `cmd` on the main loop
+
+    `callback` is called with the last complete line of each wakeup,
+    `on_error` with a message if the process exits with an error.
+    """
+
+    def __init__(self, cmd, callback, on_error, maxline=MAX_LINE_LENGTH):
+        super().__init__()
+        self._callback = callback
+        self._on_error = on_error
+
+        self.__cmd = cmd
+        self.__maxline = maxline
+        self.__partial = b''
+        self.__stderr = b''
+
+        self.proc = subprocess.Popen(cmd, shell=False,
+                                     stdin=subprocess.DEVNULL,
+                                     stdout=subprocess.PIPE,
+                                     stderr=subprocess.PIPE)
+
+        self.__streams = [self.proc.stdout, self.proc.stderr]
+        watch_stream(self.proc.stdout, self.__read_stdout)
+        watch_stream(self.proc.stderr, self.__read_stderr)
+
+    def __read_stdout(self, fd, condition, stream):
+        chunks, eof = read_available(fd)
+        data = self.__partial + b''.join(chunks)
+
+        lines = data.split(b'\n')
+        self.__partial = lines.pop()[:self.__maxline]
+        if eof and len(self.__partial) > 0:
+            lines.append(self.__partial)
+
+        # only the latest line is of interest
+        if len(lines) > 0:
+            line = lines[-1][:self.__maxline].decode('utf-8', 'replace')
+            self._callback(line)
+
+        if eof:
+            self.__close(stream)
+            return False
+
+        return True
+
+    def __read_stderr(self, fd, condition, stream):
+        chunks, eof = read_available(fd)
+        self.__stderr = (self.__stderr + b''.join(chunks))[-READ_SIZE:]
+
+        if eof:
+            self.__close(stream)
+            return False
+
+        return True
+
+    def __close(self, stream):
+        stream.close()
+        self.__streams.remove(stream)
+        if len(self.__streams) == 0:
+            self.__wait()
+
+    def __wait(self):
+        if self.proc.poll() is None:
+            # pipes closed, but process still running
+            GLib.timeout_add(10, self.__wait)
+            return False
+
+        if self.proc.returncode != 0:
+            stderr = self.__stderr.decode('utf-8', 'replace')
+            self._on_error("Backgroundprocess '{}' failed with exit code "
+                           "{:d}: {}".format(' '.join(self.__cmd),
+                                             self.proc.returncode,
+                                             stderr.rstrip()))
+
+        return False
 
 
 class Command(slice.Slice):
     def __init__(self, executable, args="", runtype=PERIODIC,
-                 maxlen=None, ellipsis='', **kwargs):
+                 maxlen=None, ellipsis='', timeout=DEFAULT_TIMEOUT, jitter=0,
+                 **kwargs):
         if runtype == PERIODIC:
             if 'interval' not in kwargs:
                 raise TypeError(
@@ -82,7 +239,15 @@ class Command(slice.Slice):
         self.__ellipsis = ellipsis
 
         self.__runtype = runtype
-        self.__cmd = [executable] + shlex.split(args)
+        if runtype == PERSISTENT:
+            self.__cmd = [executable] + shlex.split(args)
+        else:
+            # run by the shell, so pipes and redirections keep working
+            self.__cmd = ['/bin/sh', '-c',
+                          executable + (" " + args if args else "")]
+        self.__timeout = timeout
+        self.__jitter = jitter
+        self.__proc = None
 
         self._add_cut(type(self).__name__ + "-" + executable.split('/')[-1],
                       text="", index=0)
@@ -91,25 +256,31 @@ class Command(slice.Slice):
         super().initialize(manager)
 
         if self.__runtype == PERIODIC:
-            self.__timeout_id = GLib.timeout_add_seconds(self.__interval,
-                                                         self._timeout)
+            self.__timer = manager.timers.add(self.__interval, self._timeout,
+                                              jitter=self.__jitter)
         elif self.__runtype == PERSISTENT:
-            arguments = {'cmd': self.__cmd,
-                         'callback': self._signal,
-                         'on_error': self._stop_on_exception}
-            self.__exec = Thread(target=popen_background,
-                                 name="cmd-" + self.__cmd[0].split('/')[-1],
-                                 kwargs=arguments, daemon=True)
-            self.__exec.start()
+            self.__exec = popen_lines(self.__cmd,
+                                      partial(self._timed, self._signal),
+                                      self._stop_on_exception)
 
     def update(self):
         if self.__runtype != PERSISTENT:
-            retval = subprocess.run(self.__cmd, check=True, shell=True,
-                                    stdout=subprocess.PIPE,
-                                    stderr=subprocess.PIPE,
-                                    universal_newlines=True)
-            if retval.stdout is not None:
-                self.__update_text(retval.stdout.rstrip())
+            # skip this run if the previous one is still going
+            if self.__proc is not None:
+                return
+
+            self.__proc = popen_async(self.__cmd, self.__on_output,
+                                      self.__on_failure, self.__timeout)
+
+    def __on_output(self, output):
+        self.__proc = None
+        self.__update_text(output.rstrip())
+        self.propagate()
+
+    def __on_failure(self, message):
+        self.__proc = None
+        sys.stderr.write(message + "\n")
+        sys.stderr.flush()
 
     def _signal(self, line):
         if self.__runtype == PERSISTENT:
@@ -120,8 +291,7 @@ class Command(slice.Slice):
 
     def _timeout(self):
         if self.__runtype == PERIODIC:
-            self.update()
-            self.propagate()
+            self._timed(self.update)
 
             return True
 
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# © 2016 Bernd Busse, The MIT License
+#
+
+from gi.repository import Gio, GLib
+import os
+import sys
+
+from orangeslices import slice
+
+DEFAULT_DEBOUNCE = 100
+MAX_FILE_SIZE = 65536
+
+
+def first_line(content):
+    return content.split('\n', 1)[0].strip()
+
+
+class FileWatch(slice.Slice):
+    """content of a file, read again only when it changes
+
+    The parent directory is watched (inotify on Linux), so files replaced
+    by renaming a new one over them keep being followed. Reads happen at
+    most once every `debounce` milliseconds while the file is written to.
+    `formatter` turns the content into the text shown, by default its
+    first line. `missing` is shown while the file does not exist.
+    """
+
+    def __init__(self, path, formatter=first_line, missing="",
+                 debounce=DEFAULT_DEBOUNCE, **kwargs):
+        super().__init__(**kwargs)
+        self.__path = os.path.abspath(os.path.expanduser(path))
+        self.__name = os.path.basename(self.__path)
+        self.__formatter = formatter
+        self.__missing = missing
+        self.__debounce = debounce
+
+        self.__monitor = None
+        self.__timeout_id = None
+
+        self._add_cut(0, "")
+
+    def initialize(self, manager):
+        directory = Gio.File.new_for_path(os.path.dirname(self.__path))
+        self.__monitor = directory.monitor_directory(
+                Gio.FileMonitorFlags.WATCH_MOVES, None)
+        self.__monitor.set_rate_limit(self.__debounce)
+        self.__monitor.connect('changed', self.__on_changed)
+
+        super().initialize(manager)
+
+    def __on_changed(self, monitor, changed, other, event):
+        if event == Gio.FileMonitorEvent.ATTRIBUTE_CHANGED:
+            return
+        # renamed over our file or away from it
+        if (changed.get_basename() != self.__name and
+                (other is None or other.get_basename() != self.__name)):
+            return
+
+        # the first write schedules a read, following ones are part of it
+        if self.__timeout_id is None:
+            self.__timeout_id = GLib.timeout_add(self.__debounce,
+                                                 self.__reload)
+
+    def __reload(self):
+        self.__timeout_id = None
+        self._timed(self.update)
+        self.propagate()
+
+        return False
+
+    def update(self):
+        try:
+            with open(self.__path, 'r', errors='replace') as f:
+                content = f.read(MAX_FILE_SIZE)
+        except FileNotFoundError:
+            text = self.__missing
+        except OSError as e:
+            sys.stderr.write("Cannot read '{}': {}\n".format(self.__path, e))
+            sys.stderr.flush()
+            text = self.__missing
+        else:
+            text = self.__formatter(content)
+
+        self._update_cut(0, text if text is not None else "")
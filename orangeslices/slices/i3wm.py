@@ -4,9 +4,10 @@
 # © 2016 Bernd Busse, The MIT License
 #
 
+from functools import partial
 import i3ipc
 import re
-from threading import Thread
+from threading import Lock, Thread
 from time import sleep
 
 from orangeslices import slice
@@ -14,10 +15,175 @@ from orangeslices import slice
 RE_WS_TITLE = re.compile('\s*([0-9]*):?\s*(.*)?\s*', re.I)
 
 
+class i3_commands(object):
+    """query connection shared by all i3 slices
+
+    The connection is opened on first use and re-opened if i3 went away.
+    Replies are cached until `invalidate()` is called, so all lookups made
+    while handling the same event cost a single round-trip each.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.__conn = None
+        self.__cache = {}
+        self.__lock = Lock()
+
+    def __request(self, name, *args):
+        for attempt in range(3):
+            try:
+                if self.__conn is None:
+                    self.__conn = i3ipc.Connection()
+                return getattr(self.__conn, name)(*args)
+            except OSError:
+                # i3 restarted, reconnect
+                self.__conn = None
+                if attempt == 2:
+                    raise
+                sleep(0.1 * attempt)
+
+    def __query(self, name):
+        with self.__lock:
+            if name not in self.__cache:
+                self.__cache[name] = self.__request(name)
+            return self.__cache[name]
+
+    def get_workspaces(self):
+        return self.__query('get_workspaces')
+
+    def get_outputs(self):
+        return self.__query('get_outputs')
+
+    def get_tree(self):
+        return self.__query('get_tree')
+
+    def command(self, payload):
+        with self.__lock:
+            self.__cache.clear()
+            return self.__request('command', payload)
+
+    def invalidate(self):
+        with self.__lock:
+            self.__cache.clear()
+
+    def reset(self):
+        with self.__lock:
+            self.__cache.clear()
+            self.__conn = None
+
+__commands__ = None
+
+
+def get_commands():
+    global __commands__
+
+    if __commands__ is None:
+        __commands__ = i3_commands()
+
+    return __commands__
+
+
+class i3_workspace(object):
+    def __init__(self, name, output=None, focused=False, urgent=False):
+        super().__init__()
+        self.name = name
+        self.output = output
+        self.focused = focused
+        self.urgent = urgent
+
+
+class i3_state(object):
+    """workspace and window model kept up to date from the event payloads
+
+    A full resync is only done on (re)connect or when an event does not fit
+    the model. `generation` is increased on every resync.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.workspaces = {}
+        self.window = None
+        self.generation = 0
+
+    def resync(self):
+        i3 = get_commands()
+        i3.invalidate()
+
+        # keep the old model if i3 cannot be queried
+        workspaces = {}
+        for ws in i3.get_workspaces():
+            workspaces[ws.name] = i3_workspace(ws.name, ws.output,
+                                               ws.focused, ws.urgent)
+        self.workspaces = workspaces
+        self.window = None
+        self.generation += 1
+
+    def focused_window(self):
+        if self.window is None:
+            self.window = get_commands().get_tree().find_focused().name
+
+        return self.window
+
+    def update_workspace(self, event):
+        ws = event.current
+        known = ws is not None and ws.name in self.workspaces
+
+        if event.change == 'focus' and known:
+            for other in self.workspaces.values():
+                other.focused = False
+            self.workspaces[ws.name].focused = True
+            if len(ws.descendents()) == 0:
+                self.window = ""
+        elif event.change == 'init' and not known:
+            output = self.__output_of(ws)
+            if output is None:
+                return self.resync()
+            self.workspaces[ws.name] = i3_workspace(ws.name, output)
+        elif event.change == 'empty':
+            if known:
+                self.workspaces.pop(ws.name)
+        elif event.change == 'urgent' and known:
+            self.workspaces[ws.name].urgent = ws.urgent
+        elif event.change == 'move' and known:
+            output = self.__output_of(ws)
+            if output is None:
+                return self.resync()
+            self.workspaces[ws.name].output = output
+        else:
+            # rename, reload, restored or out of sync
+            self.resync()
+
+    def update_window(self, event):
+        win = event.container
+
+        if event.change == 'focus':
+            self.window = win.name
+        elif event.change == 'title' and win.focused:
+            self.window = win.name
+        elif event.change == 'close' and win.focused:
+            self.window = None
+
+    def __output_of(self, con):
+        # newer i3 versions include the output in every container
+        return getattr(con, 'ipc_data', {}).get('output')
+
+__state__ = None
+
+
+def get_state():
+    global __state__
+
+    if __state__ is None:
+        __state__ = i3_state()
+
+    return __state__
+
+
 class i3_connection(Thread):
-    def __init__(self, on_error):
+    def __init__(self, on_error, post):
         super().__init__(daemon=True)
         self._on_error = on_error
+        self._post = post
         self._ws_callback = lambda c, e: True
         self._title_callback = lambda c, e: True
 
@@ -36,24 +202,46 @@ class i3_connection(Thread):
             self._title_callback = lambda c, e: True
 
     def __ws_changed(self, conn, event):
-        if event.change in ('focus', 'init', 'empty', 'urgent'):
-            self._ws_callback(conn, event)
+        self._post(self.__dispatch_ws, conn, event)
+
+    def __title_changed(self, conn, event):
+        self._post(self.__dispatch_title, conn, event)
+
+    def __dispatch_ws(self, conn, event):
+        # fresh replies for every event, shared by all callbacks
+        get_commands().invalidate()
+        get_state().update_workspace(event)
+
+        self._ws_callback(conn, event)
         if event.change == 'focus':
             self._title_callback(conn, event)
 
-    def __title_changed(self, conn, event):
+    def __dispatch_title(self, conn, event):
+        get_commands().invalidate()
+        get_state().update_window(event)
+
         if event.change in ('focus', 'close', 'move', 'title'):
             self._title_callback(conn, event)
 
+    def __dispatch_resync(self, conn):
+        get_state().resync()
+
+        self._ws_callback(conn, None)
+        self._title_callback(conn, None)
+
     def restart(self, conn):
         conn.main_quit()
+        get_commands().reset()
 
         for _ in range(3):
             try:
                 self.conn = i3ipc.Connection()
-                break
             except FileNotFoundError:
                 sleep(0.5)
+            else:
+                # only query i3 again once it is back
+                self._post(self.__dispatch_resync, self.conn)
+                break
 
         self.conn.on('window', self.__title_changed)
         self.conn.on('workspace', self.__ws_changed)
@@ -84,65 +272,81 @@ class I3ws(slice.Slice):
 
         self.__strip_title = strip_title
 
-        self._color_fg_focused = color_fg_focused
-        self._color_bg_focused = color_bg_focused
-        self._color_hl_focused = color_hl_focused
+        self._color_fg_focused = self._color_fg
+        self._color_bg_focused = self._color_bg
+        self._color_hl_focused = self._color_hl
 
-        if self._color_fg_focused is None:
-            self._color_fg_focused = self._color_fg
-        if self._color_bg_focused is None:
-            self._color_bg_focused = self._color_bg
-        if self._color_hl_focused is None:
-            self._color_hl_focused = self._color_hl
+        if color_fg_focused is not None:
+            self._color_fg_focused = slice.SliceColor(color_fg_focused)
+        if color_bg_focused is not None:
+            self._color_bg_focused = slice.SliceColor(color_bg_focused)
+        if color_hl_focused is not None:
+            self._color_hl_focused = slice.SliceColor(color_hl_focused)
 
         self._underline_focused = underline_focused
         self._overline_focused = overline_focused
 
-        self.__outputs = self.__get_outputs()
+        self.__outputs = {}
+        self.__generation = None
 
     def initialize(self, manager):
+        self.__outputs = self.__map_outputs(manager.outputs)
         super().initialize(manager)
         global __connection__
 
         if __connection__ is None:
-            __connection__ = i3_connection(self._stop_on_exception)
+            __connection__ = i3_connection(self._stop_on_exception,
+                                           self._post)
             __connection__.start()
 
-        __connection__.register_workspace_callback(self._signal)
+        __connection__.register_workspace_callback(
+                partial(self._timed, self._signal))
 
     def update(self):
-        self.cuts.clear()
-        i3 = i3ipc.Connection()
-        for ws in i3.get_workspaces():
-            number, _ = self.__strip_name(ws.name)
-            self._add_ws(ws.name, index=number, focused=ws.focused,
-                         output=self.__outputs[ws.output])
+        state = get_state()
+        state.resync()
+        self.__rebuild(state)
 
         self.propagate()
 
     def _signal(self, conn, event):
-        ws = event.current
-        old_ws = event.old
+        state = get_state()
 
-        if event.change == 'focus':
-            self._update_ws(ws.name, focused=True)
-            if old_ws is not None:
-                if conn.get_tree().find_by_id(old_ws.id) is not None:
-                    self._update_ws(old_ws.name, focused=False)
-        elif event.change == 'init':
-            self._add_ws(ws.name, output=self.__get_output(conn, ws.name))
-        elif event.change == 'empty':
-            self._del_ws(ws.name)
-        elif event.change == 'move':
-            self._update_ws(ws.name, output=self.__get_output(conn, ws.name))
-        elif event.change == 'urgent':
-            self._update_ws(ws.name, urgent=ws.urgent)
+        if event is None or state.generation != self.__generation:
+            self.__rebuild(state)
+        else:
+            self.__sync_ws(state, event.current.name)
+            if event.change == 'focus' and event.old is not None:
+                self.__sync_ws(state, event.old.name)
 
         self.propagate()
 
         return True
 
-    def _add_ws(self, name, index=None, output=None, focused=False):
+    def __rebuild(self, state):
+        self._clear_cuts()
+        for ws in state.workspaces.values():
+            self._add_ws(ws.name, focused=ws.focused, urgent=ws.urgent,
+                         output=self.__get_output(ws.output))
+
+        self.__generation = state.generation
+
+    def __sync_ws(self, state, name):
+        ws = state.workspaces.get(name)
+        number, _ = self.__strip_name(name)
+
+        if ws is None:
+            if number in self.cuts:
+                self._del_ws(name)
+        elif number in self.cuts:
+            self._update_ws(name, focused=ws.focused, urgent=ws.urgent,
+                            output=self.__get_output(ws.output))
+        else:
+            self._add_ws(name, focused=ws.focused, urgent=ws.urgent,
+                         output=self.__get_output(ws.output))
+
+    def _add_ws(self, name, index=None, output=None, focused=False,
+                urgent=False):
         number, title = self.__strip_name(name)
         (color_fg, color_bg, color_hl,
             under, over) = self.__get_attributes(focused)
@@ -151,7 +355,8 @@ class I3ws(slice.Slice):
             number = index
 
         self._add_cut(name, title, fg=color_fg, bg=color_bg, hl=color_hl,
-                      under=under, over=over, index=number, screen=output)
+                      urgent=urgent, under=under, over=over, index=number,
+                      screen=output, action=self.__switch)
 
     def _update_ws(self, name, index=None, focused=False, urgent=False,
                    output=None):
@@ -173,6 +378,12 @@ class I3ws(slice.Slice):
 
         self._del_cut(number)
 
+    def __switch(self, cut):
+        # the workspace name is the uid, ask i3 directly instead of i3-msg
+        name = cut.uid.replace('\\', '\\\\').replace('"', '\\"')
+        get_commands().command(
+                'workspace --no-auto-back-and-forth "{}"'.format(name))
+
     def __get_attributes(self, focused=False):
         if focused:
             return (self._color_fg_focused,
@@ -201,25 +412,16 @@ class I3ws(slice.Slice):
 
         return index, title
 
-    def __get_output(self, conn, name):
-        for ws in conn.get_workspaces():
-            if ws.name == name:
-                return self.__outputs[ws.output]
+    def outputs_changed(self, outputs):
+        self.__outputs = self.__map_outputs(outputs)
+        self.__rebuild(get_state())
 
-        return slice.SCREEN_ALL
+    def __get_output(self, output):
+        return self.__outputs.get(output, slice.SCREEN_ALL)
 
-    def __get_outputs(self):
-        def position(output):
-            return output.rect.y, output.rect.x
-
-        outputs = {}
-        i3 = i3ipc.Connection()
-
-        for i, output in enumerate(sorted(
-                filter(lambda o: o.active, i3.get_outputs()), key=position)):
-            outputs[output.name] = slice.ScreenNumber.from_index(i)
-
-        return outputs
+    def __map_outputs(self, outputs):
+        # i3 uses the RandR output names
+        return {output.name: output.screen for output in outputs}
 
 
 class I3title(slice.Slice):
@@ -234,15 +436,16 @@ class I3title(slice.Slice):
         global __connection__
 
         if __connection__ is None:
-            __connection__ = i3_connection(self._stop_on_exception)
+            __connection__ = i3_connection(self._stop_on_exception,
+                                           self._post)
             __connection__.start()
 
-        __connection__.register_title_callback(self._signal)
+        __connection__.register_title_callback(
+                partial(self._timed, self._signal))
 
     def update(self):
-        self.cuts.clear()
-        i3 = i3ipc.Connection()
-        name = i3.get_tree().find_focused().name
+        self._clear_cuts()
+        name = get_state().focused_window()
         if self.__maxlen and len(name) > self.__maxlen:
             self._add_cut(0, name[:self.__maxlen].rstrip() +
                           self.__ellipsis)
@@ -252,6 +455,11 @@ class I3title(slice.Slice):
         self.propagate()
 
     def _signal(self, conn, event):
+        if event is None:
+            self.__update_title(get_state().focused_window())
+            self.propagate()
+            return True
+
         empty = False
         win = None
         try:
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# © 2016 Bernd Busse, The MIT License
+#
+
+import atexit
+import os
+
+from orangeslices import ipc
+from orangeslices import slice
+
+ATTRIBUTES = ('fg', 'bg', 'hl', 'urgent', 'under', 'over')
+TRUE = ('1', 'true', 'yes', 'on')
+
+
+def default_socket():
+    runtime = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime:
+        return os.path.join(runtime, 'orangeslices.sock')
+    return '/tmp/orangeslices-{:d}.sock'.format(os.getuid())
+
+
+class push_server(object):
+    """unix socket feeding all push slices
+
+    Every line is `id<TAB>text[<TAB>attributes]`, with attributes given as
+    space separated `key=value` pairs, e.g. `fg=#F00 urgent=1`. Replies are
+    only sent for malformed lines.
+    """
+
+    def __init__(self, path):
+        super().__init__()
+        self.slices = {}
+        self.__server = ipc.UnixServer(path, self.__on_line)
+
+    def start(self):
+        self.__server.start()
+        atexit.register(self.__server.close)
+
+    def close(self):
+        self.__server.close()
+
+    def __on_line(self, line):
+        if len(line.strip()) == 0:
+            return None
+
+        name, _, rest = line.partition('\t')
+        text, _, attributes = rest.partition('\t')
+
+        sl = self.slices.get(name)
+        if sl is None:
+            return "unknown slice '{}'\n".format(name)
+
+        try:
+            sl.push(text, **parse_attributes(attributes))
+        except ValueError as e:
+            return "invalid attributes for '{}': {}\n".format(name, e)
+
+        return None
+
+
+def parse_attributes(attributes):
+    parsed = {}
+    for pair in attributes.split():
+        key, _, value = pair.partition('=')
+        if key not in ATTRIBUTES:
+            raise ValueError("unknown attribute '{}'".format(key))
+
+        if key in ('fg', 'bg', 'hl'):
+            parsed[key] = slice.SliceColor(value)
+        else:
+            parsed[key] = value.lower() in TRUE
+
+    return parsed
+
+__servers__ = {}
+# names taken on every socket, so duplicates fail before being added
+__names__ = {}
+
+
+def get_server(path):
+    if path not in __servers__:
+        server = push_server(path)
+        server.start()
+        __servers__[path] = server
+
+    return __servers__[path]
+
+
+def release_server(path, name):
+    __names__.get(path, set()).discard(name)
+
+    server = __servers__.get(path)
+    if server is None:
+        return
+    server.slices.pop(name, None)
+    if len(server.slices) == 0:
+        server.close()
+        del __servers__[path]
+
+
+class Push(slice.Slice):
+    """text pushed by other programs over a unix socket
+
+    E.g. `printf 'mail\\t3 new\\n' | socat - UNIX-CONNECT:$SOCKET` for a
+    slice created with `name='mail'`. Pushes are drawn with the next frame,
+    so any number of them in a row costs a single redraw.
+    """
+
+    def __init__(self, name, text="", socket=None, **kwargs):
+        self.__socket = socket if socket is not None else default_socket()
+        names = __names__.setdefault(self.__socket, set())
+        if name in names:
+            raise ValueError("push slice '{}' already exists".format(name))
+
+        super().__init__(**kwargs)
+        self.name = name
+        names.add(name)
+
+        self._add_cut(0, text)
+
+    def initialize(self, manager):
+        get_server(self.__socket).slices[self.name] = self
+
+        super().initialize(manager)
+
+    def close(self):
+        release_server(self.__socket, self.name)
+
+    def push(self, text, fg=None, bg=None, hl=None, urgent=False,
+             under=None, over=None):
+        """show `text`, unset attributes fall back to the slice defaults"""
+        self._update_cut(0, text,
+                         fg=fg if fg is not None else self._color_fg,
+                         bg=bg if bg is not None else self._color_bg,
+                         hl=hl if hl is not None else self._color_hl,
+                         urgent=urgent,
+                         under=under if under is not None else self._underline,
+                         over=over if over is not None else self._overline)
+        self.propagate()
+
+    def update(self):
+        pass
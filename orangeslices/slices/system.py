@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# © 2016 Bernd Busse, The MIT License
+#
+
+from orangeslices import sampler
+from orangeslices import slice
+
+UNITS = ('B', 'K', 'M', 'G', 'T')
+
+
+def format_bytes(value):
+    for unit in UNITS[:-1]:
+        if value < 1000:
+            break
+        value /= 1024
+    else:
+        unit = UNITS[-1]
+
+    if unit == 'B':
+        return "{:.0f}{}".format(value, unit)
+    return "{:.1f}{}".format(value, unit)
+
+
+class SamplerSlice(slice.IntervalSlice):
+    """interval slice showing `fmt` filled in by `sample()`
+
+    All samplers read their sources through `orangeslices.sampler`, so
+    slices due in the same tick share one read of e.g. /proc/stat.
+    """
+
+    def __init__(self, fmt, **kwargs):
+        super().__init__(**kwargs)
+        self.__fmt = fmt
+        self._add_cut(0, "")
+
+    def sample(self):
+        raise NotImplementedError("Must be implemented by subclass!")
+
+    def update(self):
+        try:
+            values = self.sample()
+        except (OSError, ValueError, IndexError, KeyError):
+            # e.g. no such battery or interface (yet)
+            self._update_cut(0, "")
+            return
+
+        self._update_cut(0, self.__fmt.format(**values))
+
+
+class CpuSlice(SamplerSlice):
+    def __init__(self, fmt="CPU {usage:.0f}%", **kwargs):
+        super().__init__(fmt, **kwargs)
+        self.__last = None
+
+    def sample(self):
+        busy, total = sampler.cpu_times()
+        usage = 0.0
+        if self.__last is not None and total > self.__last[1]:
+            usage = (100 * (busy - self.__last[0]) /
+                     (total - self.__last[1]))
+        self.__last = (busy, total)
+
+        return {'usage': usage}
+
+
+class MemorySlice(SamplerSlice):
+    def __init__(self, fmt="MEM {percent:.0f}%", **kwargs):
+        super().__init__(fmt, **kwargs)
+
+    def sample(self):
+        info = sampler.meminfo()
+        total = info['MemTotal']
+        available = info.get('MemAvailable', info['MemFree'])
+        used = total - available
+
+        return {'total': format_bytes(total),
+                'used': format_bytes(used),
+                'available': format_bytes(available),
+                'percent': 100 * used / total}
+
+
+class BatterySlice(SamplerSlice):
+    def __init__(self, battery='BAT0', fmt="BAT {capacity:d}% {status}",
+                 **kwargs):
+        super().__init__(fmt, **kwargs)
+        self.__battery = battery
+
+    def sample(self):
+        return {'capacity': int(sampler.power_supply(self.__battery,
+                                                     'capacity')),
+                'status': sampler.power_supply(self.__battery, 'status')}
+
+
+class NetworkSlice(SamplerSlice):
+    def __init__(self, interface, fmt="{interface} {rx}/s {tx}/s",
+                 **kwargs):
+        super().__init__(fmt, **kwargs)
+        self.__interface = interface
+        self.__rx = sampler.Rate()
+        self.__tx = sampler.Rate()
+
+    def sample(self):
+        received, transmitted = sampler.net_bytes()[self.__interface]
+        rx = self.__rx.update(received)
+        tx = self.__tx.update(transmitted)
+
+        return {'interface': self.__interface,
+                'rx': format_bytes(rx),
+                'tx': format_bytes(tx),
+                'rx_rate': rx,
+                'tx_rate': tx}
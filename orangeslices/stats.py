@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# © 2016 Bernd Busse, The MIT License
+#
+
+import os
+
+# durations are recorded in microseconds, this covers more than an hour
+BUCKETS = 33
+
+
+class Histogram(object):
+    """counts values in power-of-two buckets
+
+    Recording is a handful of integer operations, so it can stay enabled.
+    Percentiles are the upper bound of their bucket, i.e. exact within a
+    factor of two.
+    """
+
+    __slots__ = ('count', 'total', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self.buckets = [0] * BUCKETS
+
+    def add(self, value):
+        value = int(value)
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        self.buckets[min(value.bit_length(), BUCKETS - 1)] += 1
+
+    def mean(self):
+        return self.total / self.count if self.count > 0 else 0
+
+    def percentile(self, fraction):
+        if self.count == 0:
+            return 0
+
+        rank = self.count * fraction
+        seen = 0
+        for i, number in enumerate(self.buckets):
+            seen += number
+            if seen >= rank:
+                return min((1 << i) - 1, self.max)
+
+        return self.max
+
+    def as_dict(self):
+        return {'count': self.count,
+                'mean': self.mean(),
+                'p50': self.percentile(0.50),
+                'p95': self.percentile(0.95),
+                'p99': self.percentile(0.99),
+                'max': self.max}
+
+
+class Stats(object):
+    """counters, histograms and gauges of a running bar"""
+
+    def __init__(self):
+        super().__init__()
+        self.counters = {}
+        self.histograms = {}
+        self.__gauges = {}
+
+    def count(self, name, number=1):
+        self.counters[name] = self.counters.get(name, 0) + number
+
+    def record(self, name, value):
+        try:
+            histogram = self.histograms[name]
+        except KeyError:
+            histogram = self.histograms[name] = Histogram()
+        histogram.add(value)
+
+    def gauge(self, name, getter):
+        """report the value returned by `getter` in every snapshot"""
+        self.__gauges[name] = getter
+
+    def reset(self):
+        self.counters.clear()
+        self.histograms.clear()
+
+    def snapshot(self):
+        return {'counters': dict(self.counters),
+                'gauges': {name: getter()
+                           for name, getter in self.__gauges.items()},
+                'histograms': {name: histogram.as_dict()
+                               for name, histogram
+                               in self.histograms.items()}}
+
+    def format(self):
+        """return a snapshot as text, one metric per line"""
+        snapshot = self.snapshot()
+        lines = []
+        for kind in ('counters', 'gauges'):
+            for name, value in sorted(snapshot[kind].items()):
+                lines.append("{} {} {}".format(kind[:-1], name, value))
+        for name, values in sorted(snapshot['histograms'].items()):
+            lines.append("histogram {} count={count:d} mean={mean:.1f} "
+                         "p50={p50:d} p95={p95:d} p99={p99:d} max={max:d}"
+                         .format(name, **values))
+
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path):
+        """write a snapshot to `path`, readers never see a partial file"""
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(self.format())
+        os.replace(tmp, path)
+
+        return True
+
+    def handle(self, line):
+        """answer a request on the stats socket"""
+        command = line.strip()
+        if command == 'reset':
+            self.reset()
+            return "ok\n\n"
+        elif command in ('', 'stats'):
+            return self.format() + '\n'
+        else:
+            return "unknown command '{}'\n\n".format(command)
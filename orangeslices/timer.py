@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# © 2016 Bernd Busse, The MIT License
+#
+
+from gi.repository import GLib
+import heapq
+from itertools import count
+import math
+import random
+import re
+import sys
+import time
+import traceback
+
+SECOND = 1
+MINUTE = 60 * SECOND
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+
+RE_DIRECTIVE = re.compile('%[-_0^#EO]*(.)')
+
+# strftime directives changing more often than once a day
+DIRECTIVE_GRANULARITY = {
+        'S': SECOND, 's': SECOND, 'T': SECOND, 'X': SECOND, 'c': SECOND,
+        'r': SECOND, '+': SECOND,
+        'M': MINUTE, 'R': MINUTE,
+        'H': HOUR, 'I': HOUR, 'k': HOUR, 'l': HOUR, 'p': HOUR, 'P': HOUR,
+        }
+
+
+def granularity(timefmt):
+    """return the number of seconds between two changes of `timefmt`"""
+    interval = DAY
+    for directive in RE_DIRECTIVE.findall(timefmt):
+        interval = min(interval, DIRECTIVE_GRANULARITY.get(directive, DAY))
+
+    return interval
+
+
+def next_boundary(interval, now=None):
+    """return the seconds until the next multiple of `interval`
+
+    Boundaries are counted in local time, so a daily timer fires at
+    midnight and not at 00:00 UTC.
+    """
+    if now is None:
+        now = time.time()
+    local = now + time.localtime(now).tm_gmtoff
+
+    return interval - local % interval
+
+
+class _Entry(object):
+    __slots__ = ('due', 'seq', 'interval', 'aligned', 'offset',
+                 'callback', 'args', 'active')
+
+    def __init__(self, seq, interval, aligned, offset, callback, args):
+        self.due = 0
+        self.seq = seq
+        self.interval = interval
+        self.aligned = aligned
+        self.offset = offset
+        self.callback = callback
+        self.args = args
+        self.active = True
+
+    def __lt__(self, other):
+        return (self.due, self.seq) < (other.due, other.seq)
+
+
+class TimerWheel(object):
+    """shared scheduler for all periodic callbacks
+
+    Due times are kept on a heap in wall-clock seconds and rounded to whole
+    seconds, so callbacks due in the same tick run together on a single
+    wake-up and `on_tick` is called once for the whole group afterwards.
+    """
+
+    def __init__(self, on_tick=None):
+        super().__init__()
+        self.__on_tick = on_tick
+        self.__heap = []
+        self.__seq = count()
+        self.__timeout_id = None
+        self.__wakeup = None
+
+    def add(self, interval, callback, *args, aligned=False, jitter=0):
+        """call `callback` every `interval` seconds until it returns `False`
+
+        With `aligned` it runs on multiples of `interval` in local time.
+        A `jitter` moves it by a random, but fixed, number of seconds below
+        that value, to keep heavy callbacks from running in the same tick.
+        Returns a handle for `remove()`.
+        """
+        offset = random.randrange(jitter) if jitter > 0 else 0
+        entry = _Entry(next(self.__seq), interval, aligned, offset,
+                       callback, args)
+        self.__push(entry, time.time())
+        self.__schedule()
+
+        return entry
+
+    def remove(self, entry):
+        entry.active = False
+
+    def stop(self):
+        if self.__timeout_id is not None:
+            GLib.source_remove(self.__timeout_id)
+            self.__timeout_id = None
+            self.__wakeup = None
+
+    def __push(self, entry, now, last=None):
+        if entry.aligned:
+            due = now + next_boundary(entry.interval, now) + entry.offset
+        elif (last is None or
+                not now <= last + entry.interval <= now + entry.interval):
+            # first run, or the wall clock was changed meanwhile
+            due = now + entry.interval + entry.offset
+        else:
+            due = last + entry.interval
+
+        # round up to the next tick, but keep exact boundaries
+        entry.due = math.ceil(due - 0.001)
+        heapq.heappush(self.__heap, entry)
+
+    def __schedule(self):
+        while len(self.__heap) > 0 and not self.__heap[0].active:
+            heapq.heappop(self.__heap)
+
+        if len(self.__heap) == 0:
+            self.stop()
+            return
+
+        due = self.__heap[0].due
+        if self.__wakeup is not None and self.__wakeup <= due:
+            return
+
+        self.stop()
+        # wake up just after the tick, never just before it
+        delay = max(0, int((due - time.time()) * 1000)) + 1
+        self.__wakeup = due
+        self.__timeout_id = GLib.timeout_add(delay, self.__tick)
+
+    def __tick(self):
+        self.__timeout_id = None
+        self.__wakeup = None
+        now = time.time()
+
+        group = []
+        while len(self.__heap) > 0 and self.__heap[0].due <= now:
+            group.append(heapq.heappop(self.__heap))
+
+        for entry in group:
+            if not entry.active:
+                continue
+
+            try:
+                keep = entry.callback(*entry.args) is not False
+            except Exception:
+                traceback.print_exc(file=sys.stderr)
+                sys.stderr.flush()
+                keep = True
+
+            if keep:
+                self.__push(entry, now, last=entry.due)
+
+        self.__schedule()
+        if len(group) > 0 and self.__on_tick is not None:
+            self.__on_tick()
+
+        return False